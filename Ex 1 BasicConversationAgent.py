@@ -2,29 +2,113 @@
 Simple Chat Agent using OpenAI API
 A basic conversational AI that maintains chat history
 
+CONVERSATION_STATE=server keeps the history on the provider side (Responses API):
+each turn sends only the new user message and the id of the previous response.
+
 """
-from openai import OpenAI
+from openai import OpenAI, APIStatusError
+import argparse
 import os 
-from dotenv import load_dotenv
+
+from agent_bootstrap import add_profile_argument, apply_profile_argument, bootstrap
 
  
 # Initialize the OpenAI client
 # Option 1: API key from environment variable (recommended)
 # Option 2: Pass it directly: client = OpenAI(api_key="your-api-key-here")
 
-env_path = os.path.join(r'C:/Users/biswa/OneDrive/Documents/Agentic ERA/Variables.env')
-
-load_dotenv(dotenv_path=env_path)
+# Load Variables.env (or $AGENTIC_ENV_FILE) and set up opt-in profiling, see agent_bootstrap.py
+profiler = bootstrap(__file__)
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# "client": resend the whole history every turn (default); "server": see ServerSideConversation
+CONVERSATION_STATE = os.getenv("CONVERSATION_STATE", "client").lower()
+
+SYSTEM_PROMPT = "You are a helpful assistant."
+
+def run_turn(messages, user_input):
+    """Send the whole history plus the new message; update `messages` in place and return the reply."""
+    # Add user message to history
+    messages.append({"role": "user", "content": user_input})
+
+    # Call OpenAI API
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",  # or "gpt-4o" for better responses
+        messages=messages,
+        temperature=0.7,
+        max_tokens=500
+
+    )
+
+    # Get assistant's reply
+    assistant_message = response.choices[0].message.content
+    # Add assistant's reply to history
+    messages.append({"role": "assistant", "content": assistant_message})
+    return assistant_message
+
+def _reference_expired(error):
+    """True if the API rejected previous_response_id because the stored response is gone."""
+    return error.status_code == 404 or getattr(error, "param", None) == "previous_response_id"
+
+class ServerSideConversation:
+    """
+    Conversation whose state is stored by the provider (Responses API with store=True).
+
+    Each turn uploads only the new user message plus previous_response_id, instead
+    of the whole history. The history is still kept locally (`messages`): if the
+    stored response has expired or was deleted, that turn resends the full history
+    and starts a new chain from its response.
+    """
+
+    def __init__(self, system_prompt=SYSTEM_PROMPT):
+        self.messages = [{"role": "system", "content": system_prompt}]
+        self.previous_response_id = None
+        self.fallbacks = 0  # turns that had to resend the full history
+
+    def _create(self, input_items, previous_response_id=None):
+        return client.responses.create(
+            model="gpt-4o-mini",
+            instructions=self.messages[0]["content"],  # instructions are not carried over by previous_response_id
+            input=input_items,
+            previous_response_id=previous_response_id,
+            store=True,
+            temperature=0.7,
+            max_output_tokens=500,
+        )
+
+    def run_turn(self, user_input):
+        """Send one user message and return the reply."""
+        user_message = {"role": "user", "content": user_input}
+        self.messages.append(user_message)
+
+        response = None
+        if self.previous_response_id:
+            try:
+                response = self._create([user_message], self.previous_response_id)
+            except APIStatusError as e:
+                if not _reference_expired(e):
+                    raise
+                self.fallbacks += 1
+        if response is None:
+            # First turn, or the stored state is gone: send the full history
+            response = self._create(self.messages[1:])
+
+        self.previous_response_id = response.id
+        assistant_message = response.output_text
+        self.messages.append({"role": "assistant", "content": assistant_message})
+        return assistant_message
  
 def chat_agent():
 
     """Main chat function that handles the conversation loop"""
     # Store conversation history
     messages = [
-        {"role": "system", "content": "You are a helpful assistant."}
+        {"role": "system", "content": SYSTEM_PROMPT}
     ]
+    conversation = ServerSideConversation() if CONVERSATION_STATE == "server" else None
+    if conversation is not None:
+        messages = conversation.messages
 
     print("Chat Agent Started! (Type 'quit' to exit)")
     print("-" * 50)
@@ -40,23 +124,12 @@ def chat_agent():
         if not user_input:
             continue
 
-        # Add user message to history
-        messages.append({"role": "user", "content": user_input})
-
         try:
-            # Call OpenAI API
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",  # or "gpt-4o" for better responses
-                messages=messages,
-                temperature=0.7,
-                max_tokens=500
-
-            )
-
-            # Get assistant's reply
-            assistant_message = response.choices[0].message.content
-            # Add assistant's reply to history
-            messages.append({"role": "assistant", "content": assistant_message})           
+            with profiler.turn(messages):
+                if conversation is not None:
+                    assistant_message = conversation.run_turn(user_input)
+                else:
+                    assistant_message = run_turn(messages, user_input)
             # Display the response
             print(f"\nAssistant: {assistant_message}")
 
@@ -67,5 +140,8 @@ def chat_agent():
             print("Please check your API key and internet connection.") 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Basic conversation agent")
+    add_profile_argument(parser)
+    profiler = apply_profile_argument(parser.parse_args(), profiler, __file__)
 
     chat_agent()
\ No newline at end of file
@@ -1,17 +1,25 @@
 from openai import OpenAI
+import argparse
 import os
-from dotenv import load_dotenv
 import requests
 import json
- 
-# Load environment
 
-env_path = os.path.join(r'C:/Users/biswa/OneDrive/Documents/Agentic ERA/Variables.env')
-load_dotenv(dotenv_path=env_path)
+from agent_bootstrap import add_profile_argument, apply_profile_argument, bootstrap
+from hedging import shared_hedger
+from tool_results import format_weather_result, condense_stale_tool_results
+ 
+# Load Variables.env (or $AGENTIC_ENV_FILE) and set up opt-in profiling, see agent_bootstrap.py
+profiler = bootstrap(__file__)
  
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Duplicate slow calls after their observed p95 when HEDGE_REQUESTS=on (see hedging.py)
+hedger = shared_hedger()
+
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+
+# Upstream endpoint (override to point at a local stand-in, see benchmarks/stub_servers.py)
+OPENWEATHER_URL = os.getenv("OPENWEATHER_URL", "https://api.openweathermap.org/data/2.5/weather")
  
 # --------- Tool implementation (Python side) ---------
 def get_current_weather(city: str, country: str, units: str):
@@ -23,7 +31,7 @@ def get_current_weather(city: str, country: str, units: str):
     if OPENWEATHER_API_KEY is None:
         return "Weather service is not configured (missing OPENWEATHER_API_KEY)."
 
-    base_url = "https://api.openweathermap.org/data/2.5/weather"
+    base_url = OPENWEATHER_URL
 
     q = f"{city},{country}"  # always both
  
@@ -34,7 +42,7 @@ def get_current_weather(city: str, country: str, units: str):
     }
  
     try:
-        resp = requests.get(base_url, params=params, timeout=10)
+        resp = hedger.call("openweather", requests.get, base_url, params=params, timeout=10)
         data = resp.json()
 
         if resp.status_code != 200:
@@ -51,15 +59,7 @@ def get_current_weather(city: str, country: str, units: str):
         wind_speed = wind.get("speed")
  
 
-        # Build a readable summary
-        parts = [
-            f"Weather in {q}: {desc}",
-            f"Temperature: {temp}° (feels like {feels_like}°)",
-            f"Humidity: {humidity}%",
-            f"Wind speed: {wind_speed} m/s",
-        ]
-
-        return " | ".join(parts)
+        return format_weather_result(q, desc, temp, feels_like, humidity, wind_speed)
 
     except Exception as e:
         return f"Error calling OpenWeather API: {e}"
@@ -131,12 +131,15 @@ def chat_agent():
         if not user_input:
             continue 
         messages.append({"role": "user", "content": user_input})
+        turn = profiler.start_turn(messages)
 
         try:
             # First call: let the model decide whether to use a tool
-            response = client.chat.completions.create(
+            response = hedger.call(
+                "openai",
+                client.chat.completions.create,
                 model="gpt-4o-mini",
-                messages=messages,
+                messages=condense_stale_tool_results(messages),
                 tools=[weather_tool],
                 tool_choice="auto",  # model can choose whether to call the tool
                 temperature=0.7,
@@ -175,9 +178,11 @@ def chat_agent():
                         )
  
                         # Second call: let the model respond to the user using the tool output
-                        followup = client.chat.completions.create(
+                        followup = hedger.call(
+                            "openai",
+                            client.chat.completions.create,
                             model="gpt-4o-mini",
-                            messages=messages,
+                            messages=condense_stale_tool_results(messages),
                             temperature=0.7,
                             max_tokens=500,
                         )
@@ -197,6 +202,11 @@ def chat_agent():
         except Exception as e:
             print(f"\nError: {e}")
             print("Please check your API keys, tool configuration, and internet connection.")
+        finally:
+            profiler.finish_turn(turn)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Weather agent")
+    add_profile_argument(parser)
+    profiler = apply_profile_argument(parser.parse_args(), profiler, __file__)
     chat_agent()
\ No newline at end of file
@@ -1,27 +1,46 @@
-from openai import OpenAI
+from openai import OpenAI, RateLimitError
+import argparse
 import os
-from dotenv import load_dotenv
 import requests
-import json
+from functools import partial
 
-# Load environment
-env_path = os.path.join(r'C:/Users/biswa/OneDrive/Documents/Agentic ERA/Variables.env')
-load_dotenv(dotenv_path=env_path)
+from agent_bootstrap import add_profile_argument, apply_profile_argument, bootstrap
+from hedging import shared_hedger
+from llm_scheduler import scheduled_completion, shared_llm_scheduler
+from streaming_tools import run_tool_decision
+from tool_cache import UpstreamError, new_weather_cache, new_air_quality_cache, weather_key
+from tool_results import format_weather_result, format_air_quality_result, condense_stale_tool_results
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Load Variables.env (or $AGENTIC_ENV_FILE) and set up opt-in profiling, see agent_bootstrap.py
+profiler = bootstrap(__file__)
+
+# Waits for RPM/TPM budget before each call when LLM_RPM_LIMIT / LLM_TPM_LIMIT are set
+llm_scheduler = shared_llm_scheduler()
+
+# With a scheduler, retries go through it instead of the SDK (see scheduled_completion())
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0 if llm_scheduler.enabled else 2)
+
+# Duplicate slow calls after their observed p95 when HEDGE_REQUESTS=on (see hedging.py)
+hedger = shared_hedger()
 
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 AIRNOW_API_KEY = os.getenv("AIRNOW_API_KEY")
 
+# Upstream endpoints (override to point at local stand-ins, see benchmarks/stub_servers.py)
+OPENWEATHER_URL = os.getenv("OPENWEATHER_URL", "https://api.openweathermap.org/data/2.5/weather")
+AIRNOW_URL = os.getenv("AIRNOW_URL", "https://www.airnowapi.org/aq/observation/zipCode/current/")
+
+# Cached tool results with background refresh of popular locations (see tool_cache.py)
+weather_cache = new_weather_cache()
+air_quality_cache = new_air_quality_cache()
+
 # --------- Tool implementation (Python side) ---------
-def get_current_weather(city: str, country: str, units: str):
+def fetch_current_weather(city: str, country: str, units: str):
     """
     Call OpenWeather current weather API and return a compact text summary.
+    Raises UpstreamError if the call fails.
     """
-    if OPENWEATHER_API_KEY is None:
-        return "Weather service is not configured (missing OPENWEATHER_API_KEY)."
-
-    base_url = "https://api.openweathermap.org/data/2.5/weather"
+    base_url = OPENWEATHER_URL
     q = f"{city},{country}"  # always both
 
     params = {
@@ -31,12 +50,12 @@ def get_current_weather(city: str, country: str, units: str):
     }
 
     try:
-        resp = requests.get(base_url, params=params, timeout=10)
+        resp = hedger.call("openweather", requests.get, base_url, params=params, timeout=10)
         data = resp.json()
 
         if resp.status_code != 200:
             msg = data.get("message", "Unknown error")
-            return f"Could not fetch weather for '{q}': {msg}."
+            raise UpstreamError(f"Could not fetch weather for '{q}': {msg}.")
 
         main = data.get("main", {})
         wind = data.get("wind", {})
@@ -47,27 +66,19 @@ def get_current_weather(city: str, country: str, units: str):
         humidity = main.get("humidity")
         wind_speed = wind.get("speed")
 
-        # Build a readable summary
-        parts = [
-            f"Weather in {q}: {desc}",
-            f"Temperature: {temp}° (feels like {feels_like}°)",
-            f"Humidity: {humidity}%",
-            f"Wind speed: {wind_speed} m/s",
-        ]
-
-        return " | ".join(parts)
+        return format_weather_result(q, desc, temp, feels_like, humidity, wind_speed)
 
+    except UpstreamError:
+        raise
     except Exception as e:
-        return f"Error calling OpenWeather API: {e}"
+        raise UpstreamError(f"Error calling OpenWeather API: {e}") from e
 
-def get_current_air_quality(zip_code: str):
+def fetch_current_air_quality(zip_code: str):
     """
     Call AirNow API for current air quality observations by ZIP code and return a compact text summary.
+    Raises UpstreamError if the call fails.
     """
-    if AIRNOW_API_KEY is None:
-        return "AirNow service is not configured (missing AIRNOW_API_KEY). Get a free key at https://docs.airnowapi.org."
-
-    base_url = "https://www.airnowapi.org/aq/observation/zipCode/current/"
+    base_url = AIRNOW_URL
     params = {
         "format": "JSON",
         "zipCode": zip_code,
@@ -76,11 +87,11 @@ def get_current_air_quality(zip_code: str):
     }
 
     try:
-        resp = requests.get(base_url, params=params, timeout=10)
+        resp = hedger.call("airnow", requests.get, base_url, params=params, timeout=10)
         data = resp.json()
 
         if resp.status_code != 200:
-            return f"Could not fetch air quality for ZIP '{zip_code}': HTTP {resp.status_code}"
+            raise UpstreamError(f"Could not fetch air quality for ZIP '{zip_code}': HTTP {resp.status_code}")
 
         if not data:
             return f"No air quality observations available for ZIP '{zip_code}'."
@@ -92,11 +103,42 @@ def get_current_air_quality(zip_code: str):
         param = obs.get("ParameterName", "Unknown")
         hour = obs.get("HourObserved", "Unknown")
 
-        summary = f"Air quality at ZIP {zip_code} ({hour}:00): AQI {aqi} ({category}) for {param}"
-        return summary
+        return format_air_quality_result(zip_code, hour, aqi, category, param)
 
+    except UpstreamError:
+        raise
     except Exception as e:
-        return f"Error calling AirNow API: {e}"
+        raise UpstreamError(f"Error calling AirNow API: {e}") from e
+
+def get_current_weather(city: str, country: str, units: str):
+    """
+    Return the current weather for a city, from weather_cache when it has a recent result.
+    """
+    if OPENWEATHER_API_KEY is None:
+        return "Weather service is not configured (missing OPENWEATHER_API_KEY)."
+
+    try:
+        return weather_cache.get(
+            weather_key(city, country, units),
+            lambda: fetch_current_weather(city, country, units),
+        )
+    except UpstreamError as e:
+        return str(e)
+
+def get_current_air_quality(zip_code: str):
+    """
+    Return current air quality for a ZIP code, from air_quality_cache when it has a recent result.
+    """
+    if AIRNOW_API_KEY is None:
+        return "AirNow service is not configured (missing AIRNOW_API_KEY). Get a free key at https://docs.airnowapi.org."
+
+    try:
+        return air_quality_cache.get(
+            zip_code.strip(),
+            lambda: fetch_current_air_quality(zip_code),
+        )
+    except UpstreamError as e:
+        return str(e)
 
 # --------- Tool schemas for the model ---------
 weather_tool = {
@@ -154,20 +196,116 @@ air_quality_tool = {
     },
 }
 
+SYSTEM_PROMPT = (
+    "You are a helpful AI assistant with access to two tools: weather (for current weather by city/country) "
+    "and air quality (for current AQI by US ZIP code via AirNow). "
+    "Call the appropriate tool(s) based on the query. You can call both if relevant. "
+    "For weather, always specify city, country, and units. For air quality, use US ZIP codes."
+)
+
+def decision_request(messages):
+    """Request body for the first call: the model decides whether to use tool(s)."""
+    return {
+        "model": "gpt-4o-mini",
+        "messages": condense_stale_tool_results(messages),
+        "tools": [weather_tool, air_quality_tool],
+        "tool_choice": "auto",  # model can choose whether/how to call tools
+        "temperature": 0.7,
+        "max_tokens": 500,
+    }
+
+def followup_request(messages):
+    """Request body for the second call: the model answers using the tool output(s)."""
+    return {
+        "model": "gpt-4o-mini",
+        "messages": condense_stale_tool_results(messages),
+        "temperature": 0.7,
+        "max_tokens": 500,
+    }
+
+def call_tool(fn_name, args):
+    """Run one tool call requested by the model and return its result text."""
+    if fn_name == "get_current_weather":
+        return get_current_weather(
+            city=args.get("city", ""),
+            country=args.get("country"),
+            units=args.get("units", "metric"),
+        )
+    elif fn_name == "get_current_air_quality":
+        return get_current_air_quality(
+            zip_code=args.get("zip_code", "")
+        )
+    return "Unknown tool."
+
+def create_completion(messages, request, followup=False, consume_stream=None):
+    """
+    Send one chat completion through the RPM/TPM scheduler and request hedging (llm_scheduler.py).
+    The conversation `messages` identifies the session; follow-up calls, which finish
+    a turn, go ahead of the first call of new turns.
+    """
+    return scheduled_completion(client, llm_scheduler, hedger, id(messages), request, followup, consume_stream)
+
+def run_turn(messages, user_input):
+    """
+    Run one user turn against the conversation `messages` (updated in place).
+    Returns the assistant's reply and the set of tools used in this turn.
+    """
+    # Track tools used in this turn
+    used_tools = set()
+
+    messages.append({"role": "user", "content": user_input})
+
+    # First call: let the model decide whether to use tool(s). The tools it asks for run as part
+    # of it (with STREAM_TOOL_CALLS, while the response is still streaming; see streaming_tools.py)
+    content, tool_calls, tool_results = run_tool_decision(
+        partial(create_completion, messages), decision_request(messages), call_tool
+    )
+
+    if tool_calls:
+        # Track tools called
+        for tool_call in tool_calls:
+            used_tools.add(tool_call["function"]["name"])
+
+        # The model wants to call one or more tools
+        messages.append(
+            {
+                "role": "assistant",
+                "tool_calls": tool_calls,
+                "content": None,
+            }
+        )
+
+        # Add the tool results to messages
+        for tool_call, tool_result in zip(tool_calls, tool_results):
+            messages.append(
+                {
+                    "role": "tool",
+                    "tool_call_id": tool_call["id"],
+                    "name": tool_call["function"]["name"],
+                    "content": tool_result,
+                }
+            )
+
+        # Second call: let the model respond using tool output(s)
+        followup = create_completion(messages, followup_request(messages), followup=True)
+
+        assistant_message = followup.choices[0].message.content
+        messages.append({"role": "assistant", "content": assistant_message})
+    else:
+        # No tool needed; respond directly
+        assistant_message = content
+        messages.append({"role": "assistant", "content": assistant_message})
+
+    return assistant_message, used_tools
+
 def chat_agent():
     """Main chat function that handles the conversation loop"""
     # Conversation history
-    messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are a helpful AI assistant with access to two tools: weather (for current weather by city/country) "
-                "and air quality (for current AQI by US ZIP code via AirNow). "
-                "Call the appropriate tool(s) based on the query. You can call both if relevant. "
-                "For weather, always specify city, country, and units. For air quality, use US ZIP codes."
-            ),
-        }
-    ]
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+
+    # Keep hot locations fresh in the background
+    weather_cache.start_refresher()
+    air_quality_cache.start_refresher()
 
     print("Multi-Agent Chat Started! (Weather + AirNow Air Quality. Type 'quit' to exit)")
     print("-" * 60)
@@ -179,87 +317,19 @@ def chat_agent():
             break
         if not user_input:
             continue 
-        
-        # Track tools used in this turn
-        used_tools = set()
-        
-        messages.append({"role": "user", "content": user_input})
 
         try:
-            # First call: let the model decide whether to use tool(s)
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages,
-                tools=[weather_tool, air_quality_tool],
-                tool_choice="auto",  # model can choose whether/how to call tools
-                temperature=0.7,
-                max_tokens=500,
-            )
-
-            choice = response.choices[0].message
-            if choice.tool_calls:
-                # Track tools called
-                for tool_call in choice.tool_calls:
-                    used_tools.add(tool_call.function.name)
-
-                # The model wants to call one or more tools
-                messages.append(
-                    {
-                        "role": "assistant",
-                        "tool_calls": choice.tool_calls,
-                        "content": None,
-                    }
-                )
-
-                # Execute all tool calls
-                for tool_call in choice.tool_calls:
-                    fn_name = tool_call.function.name
-                    args = json.loads(tool_call.function.arguments or "{}")
-
-                    if fn_name == "get_current_weather":
-                        tool_result = get_current_weather(
-                            city=args.get("city", ""),
-                            country=args.get("country"),
-                            units=args.get("units", "metric"),
-                        )
-                    elif fn_name == "get_current_air_quality":
-                        tool_result = get_current_air_quality(
-                            zip_code=args.get("zip_code", "")
-                        )
-                    else:
-                        tool_result = "Unknown tool."
-
-                    # Add tool result to messages
-                    messages.append(
-                        {
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "name": fn_name,
-                            "content": tool_result,
-                        }
-                    )
-
-                # Second call: let the model respond using tool output(s)
-                followup = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=500,
-                )
-
-                assistant_message = followup.choices[0].message.content
-                messages.append({"role": "assistant", "content": assistant_message})
-                print(f"\nAssistant: {assistant_message}")
-                
-            else:
-                # No tool needed; respond directly
-                assistant_message = choice.content
-                messages.append({"role": "assistant", "content": assistant_message})
-                print(f"\nAssistant: {assistant_message}")
+            with profiler.turn(messages):
+                assistant_message, used_tools = run_turn(messages, user_input)
+            print(f"\nAssistant: {assistant_message}")
 
             # Log tool usage for this interaction
             print_tool_usage(used_tools)
 
+        except RateLimitError as e:
+            print(f"\nError: {e}")
+            print("The OpenAI rate limit was hit; wait a moment, or set LLM_RPM_LIMIT / LLM_TPM_LIMIT to pace calls.")
+
         except Exception as e:
             print(f"\nError: {e}")
             print("Please check your API keys, tool configuration, and internet connection.")
@@ -273,4 +343,7 @@ def print_tool_usage(used_tools: set):
         print(f"🛠️ Tools used: {tools_list}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Weather + air quality agent with tool tracking")
+    add_profile_argument(parser)
+    profiler = apply_profile_argument(parser.parse_args(), profiler, __file__)
     chat_agent()
@@ -1,35 +1,99 @@
 import os
-from dotenv import load_dotenv
-import requests
+import argparse
+import asyncio
+import httpx
 from typing import TypedDict, Annotated, List
 from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage, ToolMessage
 from langgraph.graph import StateGraph, END, START
 from langgraph.prebuilt import ToolNode
+from langgraph.types import Send
 import operator
 
-# Load environment
-env_path = os.path.join(r'C:/Users/biswa/OneDrive/Documents/Agentic ERA/Variables.env')
-load_dotenv(dotenv_path=env_path)
+from agent_bootstrap import add_profile_argument, apply_profile_argument, bootstrap
+from hedging import shared_hedger
+from llm_scheduler import MAX_RETRIES, estimate_tokens, retry_delay, shared_llm_scheduler, should_retry
+from tool_cache import UpstreamError, new_weather_cache, new_air_quality_cache, weather_key
+from tool_results import format_weather_result, format_air_quality_result, condense_stale_tool_results
+
+# Load Variables.env (or $AGENTIC_ENV_FILE) and set up opt-in profiling, see agent_bootstrap.py
+profiler = bootstrap(__file__)
 
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 AIRNOW_API_KEY = os.getenv("AIRNOW_API_KEY")
 
+# Upstream endpoints (override to point at local stand-ins, see benchmarks/stub_servers.py)
+OPENWEATHER_URL = os.getenv("OPENWEATHER_URL", "https://api.openweathermap.org/data/2.5/weather")
+AIRNOW_URL = os.getenv("AIRNOW_URL", "https://www.airnowapi.org/aq/observation/zipCode/current/")
+
+# Max in-flight upstream requests per tool (tool calls in one AI message run concurrently)
+MAX_CONCURRENT_PER_TOOL = int(os.getenv("MAX_CONCURRENT_PER_TOOL", "4"))
+
+# "cycle": agent <-> tools loop (default); "fanout": plan -> one branch per location -> synthesize
+AGENT_GRAPH = os.getenv("AGENT_GRAPH", "cycle").lower()
+
+# Max location branches of one query running at once in the fan-out graph
+MAX_CONCURRENT_BRANCHES = int(os.getenv("MAX_CONCURRENT_BRANCHES", "8"))
+
+# Cached tool results with background refresh of popular locations (see tool_cache.py)
+weather_cache = new_weather_cache()
+air_quality_cache = new_air_quality_cache()
+
+# Waits for RPM/TPM budget before each LLM call when LLM_RPM_LIMIT / LLM_TPM_LIMIT are set
+llm_scheduler = shared_llm_scheduler()
+
+# Duplicate slow calls after their observed p95 when HEDGE_REQUESTS=on (see hedging.py)
+hedger = shared_hedger()
+
+# --------- Shared async HTTP client ---------
+_http_client = None
+_tool_semaphores = {}
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared async HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=10)
+    return _http_client
+
+async def close_http_client():
+    """Close the shared async HTTP client (call once the event loop is done with it)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    # The semaphores bind to the loop that first waits on them; a later asyncio.run() needs new ones
+    _tool_semaphores.clear()
+
+def tool_slot(tool_name: str) -> asyncio.Semaphore:
+    """Semaphore bounding concurrent upstream calls for one tool."""
+    if tool_name not in _tool_semaphores:
+        _tool_semaphores[tool_name] = asyncio.Semaphore(MAX_CONCURRENT_PER_TOOL)
+    return _tool_semaphores[tool_name]
+
+async def tool_get(tool_name: str, target: str, url: str, params: dict) -> httpx.Response:
+    """
+    One upstream GET for a tool, holding one of its slots. A hedged duplicate takes a slot
+    of its own; only the request itself is timed, not the wait for a slot.
+    """
+    async with tool_slot(tool_name):
+        return await hedger.acall(target, get_http_client().get, url, params=params,
+                                  hedge_guard=lambda: tool_slot(tool_name))
+
 # --------- Tool implementations ---------
-@tool
-def get_current_weather(city: str, country: str, units: str = "metric") -> str:
-    """Get the latest weather conditions for a city by calling OpenWeather API."""
-    if OPENWEATHER_API_KEY is None:
-        return "Weather service is not configured (missing OPENWEATHER_API_KEY)."
-    base_url = "https://api.openweathermap.org/data/2.5/weather"
+async def fetch_current_weather(city: str, country: str, units: str) -> str:
+    """Call OpenWeather API for a city; raises UpstreamError if the call fails."""
+    base_url = OPENWEATHER_URL
     q = f"{city},{country}"
     params = {"q": q, "appid": OPENWEATHER_API_KEY, "units": units}
     try:
-        resp = requests.get(base_url, params=params, timeout=10)
+        resp = await tool_get("get_current_weather", "openweather", base_url, params)
         data = resp.json()
         if resp.status_code != 200:
-            return f"Could not fetch weather for '{q}': {data.get('message', 'Unknown error')}."
+            raise UpstreamError(f"Could not fetch weather for '{q}': {data.get('message', 'Unknown error')}.")
         main = data.get("main", {})
         wind = data.get("wind", {})
         weather_list = data.get("weather", [])
@@ -38,28 +102,21 @@ def get_current_weather(city: str, country: str, units: str = "metric") -> str:
         feels_like = main.get("feels_like")
         humidity = main.get("humidity")
         wind_speed = wind.get("speed")
-        parts = [
-            f"Weather in {q}: {desc}",
-            f"Temperature: {temp}° (feels like {feels_like}°)",
-            f"Humidity: {humidity}%",
-            f"Wind speed: {wind_speed} m/s",
-        ]
-        return " | ".join(parts)
+        return format_weather_result(q, desc, temp, feels_like, humidity, wind_speed)
+    except UpstreamError:
+        raise
     except Exception as e:
-        return f"Error calling OpenWeather API: {e}"
+        raise UpstreamError(f"Error calling OpenWeather API: {e}") from e
 
-@tool
-def get_current_air_quality(zip_code: str) -> str:
-    """Get the latest air quality index (AQI) for a US location by ZIP code using AirNow API."""
-    if AIRNOW_API_KEY is None:
-        return "AirNow service is not configured (missing AIRNOW_API_KEY)."
-    base_url = "https://www.airnowapi.org/aq/observation/zipCode/current/"
+async def fetch_current_air_quality(zip_code: str) -> str:
+    """Call AirNow API for a ZIP code; raises UpstreamError if the call fails."""
+    base_url = AIRNOW_URL
     params = {"format": "JSON", "zipCode": zip_code, "API_KEY": AIRNOW_API_KEY, "distance": 25}
     try:
-        resp = requests.get(base_url, params=params, timeout=10)
+        resp = await tool_get("get_current_air_quality", "airnow", base_url, params)
         data = resp.json()
         if resp.status_code != 200:
-            return f"Could not fetch air quality for ZIP '{zip_code}': HTTP {resp.status_code}"
+            raise UpstreamError(f"Could not fetch air quality for ZIP '{zip_code}': HTTP {resp.status_code}")
         if not data:
             return f"No air quality observations available for ZIP '{zip_code}'."
         obs = data[0]
@@ -67,9 +124,34 @@ def get_current_air_quality(zip_code: str) -> str:
         category = obs.get("Category", {}).get("Name", "Unknown")
         param = obs.get("ParameterName", "Unknown")
         hour = obs.get("HourObserved", "Unknown")
-        return f"Air quality at ZIP {zip_code} ({hour}:00): AQI {aqi} ({category}) for {param}"
+        return format_air_quality_result(zip_code, hour, aqi, category, param)
+    except UpstreamError:
+        raise
     except Exception as e:
-        return f"Error calling AirNow API: {e}"
+        raise UpstreamError(f"Error calling AirNow API: {e}") from e
+
+@tool
+async def get_current_weather(city: str, country: str, units: str = "metric") -> str:
+    """Get the latest weather conditions for a city by calling OpenWeather API."""
+    if OPENWEATHER_API_KEY is None:
+        return "Weather service is not configured (missing OPENWEATHER_API_KEY)."
+    try:
+        return await weather_cache.aget(
+            weather_key(city, country, units),
+            lambda: fetch_current_weather(city, country, units),
+        )
+    except UpstreamError as e:
+        return str(e)
+
+@tool
+async def get_current_air_quality(zip_code: str) -> str:
+    """Get the latest air quality index (AQI) for a US location by ZIP code using AirNow API."""
+    if AIRNOW_API_KEY is None:
+        return "AirNow service is not configured (missing AIRNOW_API_KEY)."
+    try:
+        return await air_quality_cache.aget(zip_code.strip(), lambda: fetch_current_air_quality(zip_code))
+    except UpstreamError as e:
+        return str(e)
 
 # --------- State Definition ---------
 class AgentState(TypedDict):
@@ -77,12 +159,43 @@ class AgentState(TypedDict):
     tools_used: List[str]  # Track which tools were called
 
 # --------- Agent Node with Tool Tracking ---------
+async def invoke_llm(llm, runnable, messages, config, tool_schemas=None, followup=False):
+    """One LLM call through the RPM/TPM scheduler and request hedging."""
+    # Sessions share the rate limits fairly by thread_id; answering with tool results
+    # (a follow-up call that finishes the turn) goes ahead of new turns
+    session = config.get("configurable", {}).get("thread_id", "default")
+    tokens = estimate_tokens(messages, tool_schemas, llm.max_tokens)
+    # With a scheduler the SDK does not retry (see chat_model()); retries wait for a slot like any call
+    attempts = 1 + (MAX_RETRIES if llm_scheduler.enabled else 0)
+    for attempt in range(attempts):
+        try:
+            async with llm_scheduler.aslot(session, tokens, followup=followup) as call:
+                # A hedged duplicate waits for and spends its own budget, like any other call
+                response = await hedger.acall(
+                    "openai", runnable.ainvoke, messages,
+                    hedge_guard=lambda: llm_scheduler.aslot(session, tokens, followup=followup),
+                )
+                if response.usage_metadata:
+                    call.record_usage(response.usage_metadata["total_tokens"])
+            return response
+        except Exception as e:
+            if attempt + 1 == attempts or not should_retry(e):
+                raise
+            await asyncio.sleep(retry_delay(e, attempt + 1))
+
+def chat_model():
+    """The chat model for both graphs; its SDK retries are off while the RPM/TPM scheduler is on."""
+    return ChatOpenAI(model="gpt-4o-mini", temperature=0.7, max_retries=0 if llm_scheduler.enabled else 2)
+
 def create_agent(llm, tools):
     tool_names = {tool.name: tool for tool in tools}
+    llm_with_tools = llm.bind_tools(tools)
+    tool_schemas = [convert_to_openai_tool(tool) for tool in tools]  # sent with every call, counted against TPM
     
-    def agent(state: AgentState):
-        messages = state['messages']
-        response = llm.bind_tools(tools).invoke(messages)
+    async def agent(state: AgentState, config: RunnableConfig):
+        messages = condense_stale_tool_results(state['messages'])
+        followup = isinstance(messages[-1], ToolMessage)
+        response = await invoke_llm(llm, llm_with_tools, messages, config, tool_schemas, followup)
         
         # Track tools used in this agent call
         tools_used_this_turn = []
@@ -103,8 +216,9 @@ def create_agent(llm, tools):
 def create_tool_node(tools):
     tool_node = ToolNode(tools)
     
-    def tracked_tool_node(state: AgentState):
-        tool_results = tool_node.invoke(state)
+    async def tracked_tool_node(state: AgentState):
+        # ToolNode runs every tool call of the AI message concurrently
+        tool_results = await tool_node.ainvoke(state)
         
         # Extract tool names from the last tool messages
         tools_used = []
@@ -124,7 +238,7 @@ def create_tool_node(tools):
 
 # --------- Compile Graph ---------
 def create_weather_agent():
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+    llm = chat_model()
     tools = [get_current_weather, get_current_air_quality]
     
     workflow = StateGraph(state_schema=AgentState)
@@ -148,44 +262,137 @@ def create_weather_agent():
     
     return workflow.compile(), tools
 
+# --------- Fan-out Graph (map-reduce over locations) ---------
+PLANNER_PROMPT = (
+    "First look up every location the question mentions: call the tools for all of them "
+    "in this one response. Answer directly only if no lookup is needed."
+)
+
+class FanOutState(TypedDict):
+    messages: Annotated[List[BaseMessage], operator.add]
+    tools_used: Annotated[List[str], operator.add]  # parallel branches append their tool
+    location_results: Annotated[List[ToolMessage], operator.add]  # reducer: merged branch results
+
+class LocationBranch(TypedDict):
+    tool_call: dict  # one lookup from the plan
+
+def create_fanout_agent():
+    """
+    Map-reduce variant of the graph: plan -> one `lookup` branch per location -> synthesize.
+
+    The planning call extracts every location up front (as tool calls), LangGraph Send
+    runs one branch per lookup in parallel (at most MAX_CONCURRENT_BRANCHES at a time),
+    the state reducer merges their results, and a single synthesis call, which may not
+    call tools, answers. A turn costs at most two LLM calls, however the model would
+    otherwise have split its tool calls across rounds.
+    """
+    llm = chat_model()
+    tools = [get_current_weather, get_current_air_quality]
+    tools_by_name = {tool.name: tool for tool in tools}
+    planner = llm.bind_tools(tools)
+    synthesizer = llm.bind_tools(tools, tool_choice="none")  # tool results may only be read, not extended
+    tool_schemas = [convert_to_openai_tool(tool) for tool in tools]
+
+    async def plan(state: FanOutState, config: RunnableConfig):
+        messages = [SystemMessage(content=PLANNER_PROMPT)] + condense_stale_tool_results(state["messages"])
+        response = await invoke_llm(llm, planner, messages, config, tool_schemas)
+        return {"messages": [response]}
+
+    def fan_out(state: FanOutState):
+        tool_calls = state["messages"][-1].tool_calls
+        if not tool_calls:
+            return END  # the planner answered directly
+        return [Send("lookup", {"tool_call": tool_call}) for tool_call in tool_calls]
+
+    async def lookup(branch: LocationBranch):
+        tool_call = branch["tool_call"]
+        tool = tools_by_name.get(tool_call["name"])
+        print(f"🔧 EXECUTING: {tool_call['name']} {tool_call['args']}")
+        try:
+            content = await tool.ainvoke(tool_call["args"]) if tool else f"Unknown tool {tool_call['name']}."
+        except Exception as e:  # e.g. invalid arguments; reported to the model like ToolNode does
+            content = f"Error: {e}"
+        result = ToolMessage(content=content, name=tool_call["name"], tool_call_id=tool_call["id"])
+        return {"location_results": [result], "tools_used": [tool_call["name"]]}
+
+    async def synthesize(state: FanOutState, config: RunnableConfig):
+        # The branches finish in any order; put their results in the order of the plan's tool calls
+        order = {tool_call["id"]: i for i, tool_call in enumerate(state["messages"][-1].tool_calls)}
+        results = sorted(state["location_results"], key=lambda m: order.get(m.tool_call_id, len(order)))
+        messages = condense_stale_tool_results(state["messages"] + results)
+        response = await invoke_llm(llm, synthesizer, messages, config, tool_schemas, followup=True)
+        return {"messages": results + [response]}
+
+    workflow = StateGraph(state_schema=FanOutState)
+    workflow.add_node("plan", plan)
+    workflow.add_node("lookup", lookup)
+    workflow.add_node("synthesize", synthesize)
+    workflow.add_edge(START, "plan")
+    workflow.add_conditional_edges("plan", fan_out, ["lookup", END])
+    workflow.add_edge("lookup", "synthesize")  # runs once, after every branch has finished
+    workflow.add_edge("synthesize", END)
+
+    return workflow.compile().with_config(max_concurrency=MAX_CONCURRENT_BRANCHES), tools
+
+def create_graph():
+    """The graph selected by AGENT_GRAPH."""
+    return create_fanout_agent() if AGENT_GRAPH == "fanout" else create_weather_agent()
+
 # --------- Main Chat Loop with Tool Demonstration ---------
-def chat_agent():
-    app, tools = create_weather_agent()
+SYSTEM_PROMPT = (
+    "You are a helpful AI assistant with access to weather and air quality tools. "
+    "Use get_current_weather for weather queries (needs city, country, units). "
+    "Use get_current_air_quality for US ZIP code air quality queries."
+)
+
+async def chat_agent():
+    app, tools = create_graph()
     
     print("🧠 LangGraph Agent Started! (Weather + Air Quality)")
     print("📋 Available tools:", ", ".join(t.name for t in tools))
     print("=" * 60)
     
-    system_msg = HumanMessage(content=(
-        "You are a helpful AI assistant with access to weather and air quality tools. "
-        "Use get_current_weather for weather queries (needs city, country, units). "
-        "Use get_current_air_quality for US ZIP code air quality queries."
-    ))
+    system_msg = HumanMessage(content=SYSTEM_PROMPT)
     
-    while True:
-        user_input = input("\n👤 You: ").strip()
-        if user_input.lower() in ["quit", "exit", "bye"]:
-            print("👋 Goodbye!")
-            break
-        if not user_input:
-            continue
-        
-        # Run with tracked state
-        state = {"messages": [system_msg, HumanMessage(content=user_input)], "tools_used": []}
-        
-        print(f"\n🤖 Agent analyzing '{user_input}'...")
-        
-        for step, output in enumerate(app.stream(state, stream_mode="values")):
-            current_tools = output.get("tools_used", [])
-            if current_tools:
-                print(f"🎯 AGENT SELECTED TOOL: {', '.join(current_tools)}")
+    # Keep hot locations fresh in the background
+    weather_cache.start_async_refresher()
+    air_quality_cache.start_async_refresher()
+
+    try:
+        while True:
+            # Read input off the event loop so in-flight async work is not blocked
+            user_input = (await asyncio.to_thread(input, "\n👤 You: ")).strip()
+            if user_input.lower() in ["quit", "exit", "bye"]:
+                print("👋 Goodbye!")
+                break
+            if not user_input:
+                continue
+            
+            # Run with tracked state
+            state = {"messages": [system_msg, HumanMessage(content=user_input)], "tools_used": []}
+            
+            print(f"\n🤖 Agent analyzing '{user_input}'...")
             
-            # Print final response
-            if "messages" in output:
-                last_msg = output["messages"][-1]
-                if isinstance(last_msg, AIMessage) and last_msg.content:
-                    print(f"\n💬 Assistant: {last_msg.content}")
-                    break
+            with profiler.turn() as turn:
+                async for output in app.astream(state, stream_mode="values"):
+                    current_tools = output.get("tools_used", [])
+                    if current_tools:
+                        print(f"🎯 AGENT SELECTED TOOL: {', '.join(current_tools)}")
+                    
+                    # Print final response
+                    if "messages" in output:
+                        turn.messages = output["messages"]
+                        last_msg = output["messages"][-1]
+                        if isinstance(last_msg, AIMessage) and last_msg.content:
+                            print(f"\n💬 Assistant: {last_msg.content}")
+                            break
+    finally:
+        await weather_cache.stop_async_refresher()
+        await air_quality_cache.stop_async_refresher()
+        await close_http_client()
 
 if __name__ == "__main__":
-    chat_agent()
+    parser = argparse.ArgumentParser(description="LangGraph weather + air quality agent")
+    add_profile_argument(parser)
+    profiler = apply_profile_argument(parser.parse_args(), profiler, __file__)
+    asyncio.run(chat_agent())
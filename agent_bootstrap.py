@@ -0,0 +1,259 @@
+"""
+Common start-up for the Ex 1-5 agents: environment loading and opt-in profiling.
+
+Environment
+    The first file found is loaded with python-dotenv (variables that are
+    already set are never overridden):
+      1. the path in AGENTIC_ENV_FILE
+      2. Variables.env next to the example script
+      3. Variables.env or .env in the current directory
+
+Profiling (off by default; enable with AGENT_PROFILE=1 or --profile)
+    - cProfile:    every AGENT_PROFILE_SAMPLE_EVERY-th turn (default 1) is
+                   profiled and the stats are aggregated across sampled turns
+    - tracemalloc: traced memory and the size of `messages` after every turn,
+                   plus the allocation sites that grew most since the first turn
+    - on exit:     a text summary and the aggregated .prof file (for snakeviz or
+                   pstats) are written to AGENT_PROFILE_DIR (default: cwd)
+
+Usage in an example:
+
+    from agent_bootstrap import add_profile_argument, apply_profile_argument, bootstrap
+
+    profiler = bootstrap(__file__)
+    ...
+    with profiler.turn(messages):
+        ...one user turn...
+    ...
+    if __name__ == "__main__":
+        parser = argparse.ArgumentParser(description="...")
+        add_profile_argument(parser)
+        profiler = apply_profile_argument(parser.parse_args(), profiler, __file__)
+"""
+import atexit
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+ENV_FILE_NAMES = ("Variables.env", ".env")
+
+
+# --------- Environment ---------
+def find_env_file(script_path=None):
+    """Return the env file to load, or None if there is none."""
+    explicit = os.getenv("AGENTIC_ENV_FILE")
+    if explicit:
+        return explicit
+
+    candidates = []
+    if script_path:
+        candidates.append(os.path.join(os.path.dirname(os.path.abspath(script_path)), "Variables.env"))
+    candidates.extend(os.path.join(os.getcwd(), name) for name in ENV_FILE_NAMES)
+    return next((path for path in candidates if os.path.isfile(path)), None)
+
+
+def load_environment(script_path=None):
+    """Load the env file for `script_path`; return its path (or None if none was found)."""
+    env_path = find_env_file(script_path)
+    if env_path:
+        load_dotenv(dotenv_path=env_path)
+    return env_path
+
+
+# --------- Profiling ---------
+class _TurnRecord:
+    """Handle yielded by TurnProfiler.turn(); set `messages` if the history is only known at the end."""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.profile = None
+        self.wall_start = self.cpu_start = 0.0
+
+
+def _messages_size(messages):
+    """(count, serialized bytes) of a message list (OpenAI dicts or LangChain messages)."""
+    if messages is None:
+        return 0, 0
+
+    def default(obj):
+        if hasattr(obj, "model_dump"):
+            return obj.model_dump()
+        return str(obj)
+
+    try:
+        return len(messages), len(json.dumps(messages, default=default).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(messages), 0
+
+
+class TurnProfiler:
+    """Per-turn CPU and memory profiling with a summary written at exit."""
+
+    enabled = True
+
+    def __init__(self, name, sample_every=1, output_dir=".", top=25):
+        self.name = name
+        self.sample_every = max(1, sample_every)
+        self.output_dir = output_dir
+        self.top = top
+        self.turns = []
+        self._stats = None
+        self._first_snapshot = None
+        self._turn_index = 0
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+
+    @contextmanager
+    def turn(self, messages=None):
+        """Profile one user turn; `messages` is measured after the turn ends."""
+        record = self.start_turn(messages)
+        try:
+            yield record
+        finally:
+            self.finish_turn(record)
+
+    def start_turn(self, messages=None):
+        """turn() for loops that cannot wrap their turn in a with block; pass the result to finish_turn()."""
+        self._turn_index += 1
+        record = _TurnRecord(messages)
+        if (self._turn_index - 1) % self.sample_every == 0:
+            record.profile = cProfile.Profile()
+        record.wall_start, record.cpu_start = time.perf_counter(), time.process_time()
+        if record.profile is not None:
+            record.profile.enable()
+        return record
+
+    def finish_turn(self, record):
+        profile = record.profile
+        if profile is not None:
+            profile.disable()
+        wall, cpu = time.perf_counter() - record.wall_start, time.process_time() - record.cpu_start
+
+        if profile is not None:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+        current, peak = tracemalloc.get_traced_memory()
+        if self._first_snapshot is None:
+            self._first_snapshot = tracemalloc.take_snapshot()
+
+        count, size = _messages_size(record.messages)
+        self.turns.append({
+            "turn": self._turn_index,
+            "wall_ms": wall * 1000,
+            "cpu_ms": cpu * 1000,
+            "sampled": profile is not None,
+            "traced_kb": current / 1024,
+            "peak_kb": peak / 1024,
+            "messages": count,
+            "messages_kb": size / 1024,
+        })
+
+    def summary(self):
+        """Return the profiling report as text."""
+        out = io.StringIO()
+        out.write(f"Agent profile: {self.name} ({len(self.turns)} turns, "
+                  f"cProfile every {self.sample_every} turn(s))\n\n")
+
+        out.write(f"{'turn':>5} {'wall ms':>9} {'cpu ms':>8} {'cProf':>5} {'traced KB':>10} "
+                  f"{'peak KB':>9} {'msgs':>5} {'msgs KB':>8}\n")
+        for t in self.turns:
+            out.write(f"{t['turn']:>5} {t['wall_ms']:>9.1f} {t['cpu_ms']:>8.1f} {'yes' if t['sampled'] else '':>5} "
+                      f"{t['traced_kb']:>10.1f} {t['peak_kb']:>9.1f} {t['messages']:>5} {t['messages_kb']:>8.1f}\n")
+        if self.turns:
+            wall = sum(t["wall_ms"] for t in self.turns)
+            cpu = sum(t["cpu_ms"] for t in self.turns)
+            share = f" ({cpu / wall:.0%} of wall time on CPU; the rest is mostly network wait)" if wall else ""
+            out.write(f"\nTotal wall {wall:.0f} ms, CPU {cpu:.0f} ms{share}\n")
+
+        if self._stats is not None:
+            out.write(f"\n--- cProfile, sampled turns, top {self.top} by cumulative time ---\n")
+            self._stats.stream = out
+            self._stats.sort_stats("cumulative").print_stats(self.top)
+            out.write(f"\n--- cProfile, sampled turns, top {self.top} by own time ---\n")
+            self._stats.sort_stats("tottime").print_stats(self.top)
+
+        if self._first_snapshot is not None:
+            out.write(f"\n--- tracemalloc, top {self.top} allocation sites grown since turn 1 ---\n")
+            growth = tracemalloc.take_snapshot().compare_to(self._first_snapshot, "lineno")
+            for stat in growth[:self.top]:
+                out.write(f"{stat}\n")
+        return out.getvalue()
+
+    def write_summary(self):
+        """Write the text summary (and .prof stats, if any turn was sampled); return the summary path."""
+        if not self.turns:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        stem = os.path.join(self.output_dir, f"agent_profile_{self.name}_{os.getpid()}")
+        with open(f"{stem}.txt", "w", encoding="utf-8") as f:
+            f.write(self.summary())
+        if self._stats is not None:
+            self._stats.dump_stats(f"{stem}.prof")
+        print(f"\n📊 Profile summary written to {stem}.txt")
+        return f"{stem}.txt"
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off; turn() costs next to nothing."""
+
+    enabled = False
+
+    @contextmanager
+    def turn(self, messages=None):
+        yield _TurnRecord(messages)
+
+    def start_turn(self, messages=None):
+        return _TurnRecord(messages)
+
+    def finish_turn(self, record):
+        pass
+
+    def write_summary(self):
+        return None
+
+
+def profiling_requested():
+    return os.getenv("AGENT_PROFILE", "").lower() in ("1", "true", "yes")
+
+
+def start_profiling(script_path=None):
+    """Return a TurnProfiler for an example script that writes its summary at exit."""
+    name = os.path.splitext(os.path.basename(script_path or "agent"))[0].replace(" ", "_")
+    profiler = TurnProfiler(
+        name,
+        sample_every=int(os.getenv("AGENT_PROFILE_SAMPLE_EVERY", "1")),
+        output_dir=os.getenv("AGENT_PROFILE_DIR", "."),
+    )
+    atexit.register(profiler.write_summary)
+    return profiler
+
+
+# --------- Command line ---------
+def add_profile_argument(parser):
+    """Add --profile (same as AGENT_PROFILE=1) to an example's argument parser."""
+    parser.add_argument("--profile", action="store_true", help="profile each turn (same as AGENT_PROFILE=1)")
+
+
+def apply_profile_argument(args, profiler, script_path=None):
+    """The profiler to use after parsing: `profiler`, or a new TurnProfiler if --profile was given."""
+    if args.profile and not profiler.enabled:
+        return start_profiling(script_path)
+    return profiler
+
+
+# --------- Entry point ---------
+def bootstrap(script_path=None):
+    """Load the environment for an example script and return its turn profiler (see AGENT_PROFILE)."""
+    load_environment(script_path)
+    return start_profiling(script_path) if profiling_requested() else NullProfiler()
@@ -0,0 +1,102 @@
+"""
+Run chat completion requests through the OpenAI Batch API instead of one at a time.
+
+Batch jobs cost about half the on-demand price and draw on a separate rate
+limit, at the price of latency (results arrive within the completion window,
+usually minutes). That suits offline work such as precomputing briefings; the
+interactive agents keep using the on-demand API.
+
+One batch round trip:
+    1. write_batch_file():  one JSONL line per request, keyed by custom_id
+    2. submit_batch():      upload the file and create the batch job
+    3. wait_for_batch():    poll until the job is completed (or fails)
+    4. read_batch_results(): download the output and error files
+
+run_batch() does all four. Point OPENAI_BASE_URL at the local stand-in
+(benchmarks/stub_servers.py) to run it without an API key.
+"""
+import json
+import os
+import time
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchError(Exception):
+    """The batch job did not complete, or its results could not be read."""
+
+
+def write_batch_file(path, requests):
+    """Write [(custom_id, request body), ...] as a batch input file; return the path."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, body in requests:
+            line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return path
+
+
+def submit_batch(client, path, completion_window="24h", metadata=None):
+    """Upload a batch input file and create the job; return the Batch object."""
+    with open(path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    return client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=completion_window,
+        metadata=metadata,
+    )
+
+
+def wait_for_batch(client, batch_id, poll_interval=30.0, timeout=None, on_poll=None):
+    """Poll until the batch reaches a final status; return it, or raise BatchError if it did not complete."""
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if on_poll is not None:
+            on_poll(batch)
+        if batch.status in FINAL_STATUSES:
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            raise BatchError(f"Batch {batch_id} still {batch.status} after {timeout:.0f}s")
+        time.sleep(poll_interval)
+
+    if batch.status != "completed":
+        errors = getattr(batch, "errors", None)
+        detail = "; ".join(e.message for e in (errors.data or [])) if errors and errors.data else batch.status
+        raise BatchError(f"Batch {batch_id} {batch.status}: {detail}")
+    return batch
+
+
+def read_batch_results(client, batch):
+    """Return {custom_id: (response body, None) or (None, error message)} for a completed batch."""
+    results = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if item.get("error"):
+                results[item["custom_id"]] = (None, item["error"].get("message", "request failed"))
+            elif response.get("status_code") != 200:
+                message = (response.get("body") or {}).get("error", {}).get("message", "request failed")
+                results[item["custom_id"]] = (None, f"HTTP {response.get('status_code')}: {message}")
+            else:
+                results[item["custom_id"]] = (response["body"], None)
+    return results
+
+
+def run_batch(client, path, requests, poll_interval=30.0, timeout=None, on_poll=None):
+    """Write, submit and wait for one batch of [(custom_id, body), ...]; return read_batch_results()."""
+    write_batch_file(path, requests)
+    batch = submit_batch(client, path)
+    batch = wait_for_batch(client, batch.id, poll_interval=poll_interval, timeout=timeout, on_poll=on_poll)
+    results = read_batch_results(client, batch)
+    for custom_id, _ in requests:
+        results.setdefault(custom_id, (None, "missing from batch output"))
+    return results
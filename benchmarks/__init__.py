@@ -0,0 +1 @@
+"""Benchmarks for the Ex 1-5 agents. Run modules from the repository root with `python -m benchmarks.<name>`."""
@@ -0,0 +1,105 @@
+"""
+Bytes sent and latency per turn for Ex 1: full history vs provider-side conversation state.
+
+Drives one scripted conversation through Ex 1 twice against the local
+stand-in: once with run_turn() (the whole `messages` list is uploaded every
+turn) and once with ServerSideConversation (only the new user message plus
+previous_response_id). Request bytes are counted on the client, so retries and
+fallback requests are included.
+
+--expire-at N deletes the stored conversation before turn N, so that turn
+exercises the fallback (it resends the full history and starts a new chain).
+The same works against the real API with --record (see cassettes.py).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_conversation_state --turns 20 --llm-latency fixed:300
+    python -m benchmarks.bench_conversation_state --turns 20 --expire-at 10
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+
+import httpx
+from openai import OpenAI
+
+from benchmarks.cassettes import add_cassette_arguments, start_cassette_from_args
+from benchmarks.stub_servers import add_stub_arguments, start_from_args
+from example_loader import load_example
+
+PROMPTS = [
+    "I'm planning a week-long trip to Portugal in the spring. Where should I start?",
+    "What would a realistic daily budget look like for mid-range hotels and food?",
+    "Is it worth renting a car, or are trains and buses good enough between the cities?",
+    "Suggest a day-by-day itinerary that covers Lisbon, Sintra and Porto.",
+    "Which local dishes should I try, and where are they best?",
+    "How much Portuguese should I learn before going, and which phrases matter most?",
+]
+
+
+def prompt_for(turn):
+    return f"{PROMPTS[turn % len(PROMPTS)]} (turn {turn + 1})"
+
+
+def instrumented_client(sent):
+    """An OpenAI client (configured from the environment) that appends the size of every request body to `sent`."""
+    def on_request(request):
+        sent.append(len(request.content))
+    return OpenAI(http_client=httpx.Client(event_hooks={"request": [on_request]}))
+
+
+def run_conversation(module, mode, turns, expire_at, sent):
+    """Run the scripted conversation in `mode` ("client" or "server"); return [(bytes sent, latency ms), ...]."""
+    rows = []
+    messages = [{"role": "system", "content": module.SYSTEM_PROMPT}]
+    conversation = module.ServerSideConversation() if mode == "server" else None
+    for turn in range(turns):
+        if conversation is not None and turn + 1 == expire_at and conversation.previous_response_id:
+            module.client.responses.delete(conversation.previous_response_id)
+        sent.clear()
+        start = time.perf_counter()
+        if conversation is not None:
+            conversation.run_turn(prompt_for(turn))
+        else:
+            module.run_turn(messages, prompt_for(turn))
+        rows.append((sum(sent), (time.perf_counter() - start) * 1000))
+    return rows, conversation.fallbacks if conversation is not None else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-history and provider-side conversation state in Ex 1")
+    parser.add_argument("--turns", type=int, default=20, help="turns in the scripted conversation")
+    parser.add_argument("--expire-at", type=int, default=0, help="delete the stored conversation before this turn")
+    add_stub_arguments(parser)
+    add_cassette_arguments(parser)
+    args = parser.parse_args()
+
+    stack = start_cassette_from_args(args) or start_from_args(args)
+    os.environ.update(stack.env())
+    sent = []
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            module = load_example(1)
+        module.client = instrumented_client(sent)
+        full, _ = run_conversation(module, "client", args.turns, 0, sent)
+        stored, fallbacks = run_conversation(module, "server", args.turns, args.expire_at, sent)
+    finally:
+        stack.stop()
+
+    print(f"Ex 1, {args.turns} turns: full history vs provider-side state (previous_response_id)\n")
+    print(f"{'turn':>5} {'history B':>10} {'stored B':>9} {'history ms':>11} {'stored ms':>10}")
+    print("-" * 50)
+    for turn, ((full_bytes, full_ms), (stored_bytes, stored_ms)) in enumerate(zip(full, stored), start=1):
+        print(f"{turn:>5} {full_bytes:>10} {stored_bytes:>9} {full_ms:>11.1f} {stored_ms:>10.1f}")
+    print("-" * 50)
+    full_total, stored_total = sum(b for b, _ in full), sum(b for b, _ in stored)
+    print(f"{'total':>5} {full_total:>10} {stored_total:>9} "
+          f"{sum(ms for _, ms in full):>11.1f} {sum(ms for _, ms in stored):>10.1f}")
+    if full_total:
+        print(f"\nUploaded {stored_total / full_total:.0%} of the full-history bytes; "
+              f"{fallbacks} turn(s) fell back to the full history.")
+
+
+if __name__ == "__main__":
+    main()
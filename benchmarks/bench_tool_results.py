@@ -0,0 +1,195 @@
+"""
+Prompt tokens and latency per turn: prose vs compact tool results.
+
+Replays a scripted weather/air-quality session through the Ex 3 turn shape
+(user message -> assistant tool calls -> tool results -> follow-up call) once
+with TOOL_RESULT_FORMAT=prose and once with compact. The tool calls and
+observations are fixed, so both runs send exactly the same conversation except
+for the tool result text. Only the follow-up call is timed, because that is the
+call that resends the whole history.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_tool_results                # live, uses OPENAI_API_KEY / OPENAI_BASE_URL
+    python -m benchmarks.bench_tool_results --offline      # token estimates only, no API calls
+"""
+import argparse
+import functools
+import json
+import os
+import time
+
+from tool_results import format_weather_result, format_air_quality_result, condense_stale_tool_results
+
+SYSTEM_PROMPT = (
+    "You are a helpful AI assistant with access to two tools: weather (for current weather by city/country) "
+    "and air quality (for current AQI by US ZIP code via AirNow). "
+    "Call the appropriate tool(s) based on the query. You can call both if relevant. "
+    "For weather, always specify city, country, and units. For air quality, use US ZIP codes."
+)
+
+# (user question, [(tool name, arguments, observation fields)])
+SESSION = [
+    ("What's the weather in Paris, France?", [
+        ("get_current_weather", {"city": "Paris", "country": "FR", "units": "metric"},
+         {"desc": "light rain", "temp": 7.31, "feels_like": 4.86, "humidity": 81, "wind_speed": 4.12}),
+    ]),
+    ("And the air quality near ZIP 10001?", [
+        ("get_current_air_quality", {"zip_code": "10001"},
+         {"hour": 14, "aqi": 42, "category": "Good", "param": "O3"}),
+    ]),
+    ("Compare Berlin and Madrid right now.", [
+        ("get_current_weather", {"city": "Berlin", "country": "DE", "units": "metric"},
+         {"desc": "overcast clouds", "temp": 3.92, "feels_like": 0.47, "humidity": 87, "wind_speed": 5.66}),
+        ("get_current_weather", {"city": "Madrid", "country": "ES", "units": "metric"},
+         {"desc": "clear sky", "temp": 14.58, "feels_like": 13.27, "humidity": 48, "wind_speed": 2.06}),
+    ]),
+    ("Weather in Chicago in Fahrenheit, plus AQI for 60601.", [
+        ("get_current_weather", {"city": "Chicago", "country": "US", "units": "imperial"},
+         {"desc": "few clouds", "temp": 41.18, "feels_like": 34.02, "humidity": 63, "wind_speed": 11.5}),
+        ("get_current_air_quality", {"zip_code": "60601"},
+         {"hour": 14, "aqi": 57, "category": "Moderate", "param": "PM2.5"}),
+    ]),
+    ("Is it warmer in Tokyo or Sydney?", [
+        ("get_current_weather", {"city": "Tokyo", "country": "JP", "units": "metric"},
+         {"desc": "scattered clouds", "temp": 16.04, "feels_like": 15.21, "humidity": 59, "wind_speed": 3.6}),
+        ("get_current_weather", {"city": "Sydney", "country": "AU", "units": "metric"},
+         {"desc": "broken clouds", "temp": 21.77, "feels_like": 21.69, "humidity": 70, "wind_speed": 6.17}),
+    ]),
+    ("Air quality for 94103 and 98101?", [
+        ("get_current_air_quality", {"zip_code": "94103"},
+         {"hour": 14, "aqi": 35, "category": "Good", "param": "PM2.5"}),
+        ("get_current_air_quality", {"zip_code": "98101"},
+         {"hour": 14, "aqi": 22, "category": "Good", "param": "O3"}),
+    ]),
+]
+
+OFFLINE_REPLY = "Here is a short summary of the current conditions you asked about."
+
+
+def tool_result(name, args, obs, result_format):
+    if name == "get_current_weather":
+        q = f"{args['city']},{args['country']}"
+        return format_weather_result(q, result_format=result_format, **obs)
+    return format_air_quality_result(args["zip_code"], result_format=result_format, **obs)
+
+
+@functools.lru_cache(maxsize=None)
+def _token_encoder():
+    """tiktoken's encoder if it is installed and its vocabulary is available, else ~4 characters per token."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base").encode
+    except Exception:
+        return lambda text: range(len(text) // 4 + 1)
+
+
+def estimate_prompt_tokens(messages):
+    """Rough chat prompt token count."""
+    encode = _token_encoder()
+    tokens = 3  # reply priming
+    for message in messages:
+        tokens += 4  # per-message framing
+        for value in (message.get("content"), message.get("name")):
+            if value:
+                tokens += len(encode(value))
+        for call in message.get("tool_calls") or []:
+            tokens += len(encode(call["function"]["name"])) + len(encode(call["function"]["arguments"]))
+    return tokens
+
+
+def run_session(result_format, turns, client=None, model="gpt-4o-mini"):
+    """Replay `turns` scripted turns; return one stats dict per turn."""
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    stats = []
+
+    for turn in range(turns):
+        question, calls = SESSION[turn % len(SESSION)]
+        messages.append({"role": "user", "content": question})
+        messages.append({
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": f"call_{turn}_{i}",
+                    "type": "function",
+                    "function": {"name": name, "arguments": json.dumps(args)},
+                }
+                for i, (name, args, _) in enumerate(calls)
+            ],
+        })
+        for i, (name, args, obs) in enumerate(calls):
+            messages.append({
+                "role": "tool",
+                "tool_call_id": f"call_{turn}_{i}",
+                "name": name,
+                "content": tool_result(name, args, obs, result_format),
+            })
+
+        prompt = condense_stale_tool_results(messages)
+        prompt_bytes = len(json.dumps(prompt, ensure_ascii=False).encode("utf-8"))
+
+        if client is None:
+            prompt_tokens = estimate_prompt_tokens(prompt)
+            latency_ms = None
+            reply = OFFLINE_REPLY
+        else:
+            start = time.perf_counter()
+            followup = client.chat.completions.create(
+                model=model,
+                messages=prompt,
+                temperature=0,
+                max_tokens=150,
+            )
+            latency_ms = (time.perf_counter() - start) * 1000
+            prompt_tokens = followup.usage.prompt_tokens if followup.usage else estimate_prompt_tokens(prompt)
+            reply = followup.choices[0].message.content or ""
+
+        messages.append({"role": "assistant", "content": reply})
+        stats.append({"prompt_tokens": prompt_tokens, "prompt_bytes": prompt_bytes, "latency_ms": latency_ms})
+
+    return stats
+
+
+def print_report(prose, compact):
+    def ms(value):
+        return f"{value:9.0f}" if value is not None else f"{'-':>9}"
+
+    print(f"{'turn':>4} | {'prose tok':>9} {'compact tok':>11} {'saved':>6} | {'prose ms':>9} {'compact ms':>10}")
+    print("-" * 60)
+    for turn, (p, c) in enumerate(zip(prose, compact), start=1):
+        saved = 1 - c["prompt_tokens"] / p["prompt_tokens"]
+        print(f"{turn:>4} | {p['prompt_tokens']:>9} {c['prompt_tokens']:>11} {saved:>6.1%} | "
+              f"{ms(p['latency_ms'])} {ms(c['latency_ms']):>10}")
+
+    total_p = sum(s["prompt_tokens"] for s in prose)
+    total_c = sum(s["prompt_tokens"] for s in compact)
+    bytes_p = sum(s["prompt_bytes"] for s in prose)
+    bytes_c = sum(s["prompt_bytes"] for s in compact)
+    print("-" * 60)
+    print(f"Total prompt tokens: prose {total_p}, compact {total_c} ({1 - total_c / total_p:.1%} saved)")
+    print(f"Total prompt bytes:  prose {bytes_p}, compact {bytes_c} ({1 - bytes_c / bytes_p:.1%} saved)")
+    if prose[0]["latency_ms"] is not None:
+        lat_p = sum(s["latency_ms"] for s in prose) / len(prose)
+        lat_c = sum(s["latency_ms"] for s in compact) / len(compact)
+        print(f"Mean follow-up latency: prose {lat_p:.0f} ms, compact {lat_c:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=len(SESSION), help="number of scripted turns to replay")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--offline", action="store_true", help="estimate tokens locally, make no API calls")
+    args = parser.parse_args()
+
+    client = None
+    if not args.offline:
+        from openai import OpenAI
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    prose = run_session("prose", args.turns, client, args.model)
+    compact = run_session("compact", args.turns, client, args.model)
+    print_report(prose, compact)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Throughput of the multi-process worker pool (worker_pool.py) by worker count.
+
+Starts the local stand-ins, then for each worker count drives N simulated
+users (sticky sessions, several turns each) through a WorkerPool and reports
+turns/s, p50/p95/p99 turn latency and the per-worker load table. The workers
+share tool results through a temporary TOOL_CACHE_DB.
+
+With realistic LLM latency the agents mostly wait on the network; use a fast
+stand-in (--llm-latency fixed:5 --tool-latency fixed:1) to see how the
+CPU-bound part scales with cores.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_worker_pool --agent ex3 --workers 1,2,4 --users 64 --turns 5
+    python -m benchmarks.bench_worker_pool --agent ex5 --max-turns-per-worker 50
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.load_test import prompt_for
+from benchmarks.metrics import LatencyRecorder
+from benchmarks.stub_servers import add_stub_arguments, start_from_args
+from worker_pool import AGENTS, WorkerPool, print_worker_table
+
+
+def run_pool(agent, workers, users, turns, concurrency, max_turns_per_worker):
+    recorder = LatencyRecorder()
+    with WorkerPool(agent, workers=workers, concurrency=concurrency,
+                    max_turns_per_worker=max_turns_per_worker) as pool:
+
+        def user_session(user):
+            for turn in range(turns):
+                try:
+                    with recorder.time("turn"):
+                        pool.run_turn(f"user-{user}", prompt_for(user, turn))
+                except Exception:
+                    pass  # counted by recorder.time()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as clients:
+            list(clients.map(user_session, range(users)))
+        wall = time.perf_counter() - start
+        stats = pool.stats()
+    return recorder.summary().get("turn"), wall, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker pool throughput by worker count")
+    parser.add_argument("--agent", default="ex3", choices=sorted(AGENTS))
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}", help="comma-separated worker counts")
+    parser.add_argument("--users", type=int, default=32, help="concurrent simulated users (sessions)")
+    parser.add_argument("--turns", type=int, default=5, help="turns per user")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent turns inside each worker")
+    parser.add_argument("--max-turns-per-worker", type=int, default=1000, help="recycle a worker after this many turns")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    stack = start_from_args(args)
+    os.environ.update(stack.env())  # inherited by the worker processes
+    cache_dir = tempfile.TemporaryDirectory()
+    os.environ["TOOL_CACHE_DB"] = os.path.join(cache_dir.name, "tool_cache.sqlite")
+
+    results = []
+    try:
+        for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+            turn, wall, stats = run_pool(args.agent, workers, args.users, args.turns,
+                                         args.concurrency, args.max_turns_per_worker)
+            results.append((workers, turn, wall))
+            print(f"\n{args.agent} with {workers} worker(s): {args.users} users x {args.turns} turns in {wall:.2f}s")
+            print_worker_table(stats)
+    finally:
+        stack.stop()
+        cache_dir.cleanup()
+
+    print("\nComparison (latencies in ms)")
+    print(f"{'workers':>7} {'turns':>6} {'errors':>6} {'turns/s':>8} {'speed-up':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    print("-" * 66)
+    baseline = None
+    for workers, turn, wall in results:
+        rate = turn["count"] / wall if wall else 0.0
+        baseline = baseline or rate
+        print(f"{workers:>7} {turn['count']:>6} {turn['errors']:>6} {rate:>8.2f} {rate / baseline if baseline else 0:>7.2f}x "
+              f"{turn['p50']:>8.1f} {turn['p95']:>8.1f} {turn['p99']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
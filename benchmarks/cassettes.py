@@ -0,0 +1,328 @@
+"""
+Record and replay the agents' HTTP traffic (OpenAI, OpenWeather, AirNow) as cassettes.
+
+Record mode runs one local proxy per upstream. It forwards every request to
+the real API and appends the exchange to a cassette: request, response,
+status and the upstream latency. Replay mode serves the same endpoints from
+the cassette, sleeping either the recorded latency or not at all. With zero
+latency a benchmark measures only the agent loop's own CPU work, with no
+network access and no API spend, so it can run in CI.
+
+The examples read OPENAI_BASE_URL, OPENWEATHER_URL and AIRNOW_URL, so Ex 1-5
+(and benchmarks.load_test) need no changes: point them at the proxy.
+
+Cassette files are gzip-compressed JSON lines, one exchange per line.
+API keys are never written: the Authorization header is not stored, and the
+appid / API_KEY query parameters are dropped. A request is matched on
+upstream, method, path, remaining query and the canonical JSON body.
+Repeated identical requests replay their recorded responses in order; once
+those run out, the last one is repeated. Unmatched requests get a 400 and are
+counted as misses.
+
+Usage (from the repository root):
+    python -m benchmarks.cassettes record sessions/ex3.cassette.gz   # then run an example against the printed env
+    python -m benchmarks.cassettes replay sessions/ex3.cassette.gz --latency zero
+    python -m benchmarks.load_test --agents ex3 --record sessions/load.cassette.gz --llm-upstream https://api.openai.com
+    python -m benchmarks.load_test --agents ex3 --replay sessions/load.cassette.gz --replay-latency zero
+"""
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import httpx
+
+CASSETTE_VERSION = 1
+SECRET_QUERY_PARAMS = {"appid", "api_key"}  # compared case-insensitively
+FORWARDED_HEADERS = {"authorization", "content-type", "accept", "user-agent", "openai-organization", "openai-project"}
+
+# Upstream name -> (environment variable the examples read, its default URL)
+UPSTREAMS = {
+    "llm": ("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+    "openweather": ("OPENWEATHER_URL", "https://api.openweathermap.org/data/2.5/weather"),
+    "airnow": ("AIRNOW_URL", "https://www.airnowapi.org/aq/observation/zipCode/current/"),
+}
+REPLAY_KEYS = {"OPENAI_API_KEY": "replay-key", "OPENWEATHER_API_KEY": "replay-key", "AIRNOW_API_KEY": "replay-key"}
+
+
+# --------- Cassette ---------
+def _clean_query(query):
+    """The query string without API keys, in a stable order."""
+    pairs = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k.lower() not in SECRET_QUERY_PARAMS]
+    return urlencode(sorted(pairs))
+
+
+def _canonical_body(body):
+    if not body:
+        return ""
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        return body
+
+
+def match_key(upstream, method, path, query, body):
+    return upstream, method, path, _clean_query(query), _canonical_body(body)
+
+
+class Cassette:
+    """Recorded exchanges, looked up by match_key()."""
+
+    def __init__(self, interactions=None, meta=None):
+        self.interactions = list(interactions or [])
+        self.meta = meta or {"version": CASSETTE_VERSION, "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        self._lock = threading.Lock()
+        self._queues = None
+        self._last = {}
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        if not lines or lines[0].get("version") != CASSETTE_VERSION:
+            raise ValueError(f"{path} is not a version {CASSETTE_VERSION} cassette")
+        return cls(lines[1:], lines[0])
+
+    def save(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            interactions = list(self.interactions)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            for item in [self.meta, *interactions]:
+                f.write(json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n")
+        return path
+
+    def record(self, upstream, method, path, query, body, status, content_type, response, latency):
+        with self._lock:
+            self.interactions.append({
+                "upstream": upstream,
+                "method": method,
+                "path": path,
+                "query": _clean_query(query),
+                "body": body or None,
+                "status": status,
+                "content_type": content_type,
+                "response": response,
+                "latency_ms": round(latency * 1000, 1),
+            })
+
+    def next_response(self, upstream, method, path, query, body):
+        """The next recorded exchange for this request, or None if there is none."""
+        key = match_key(upstream, method, path, query, body)
+        with self._lock:
+            if self._queues is None:
+                self._queues = defaultdict(deque)
+                for item in self.interactions:
+                    item_key = match_key(item["upstream"], item["method"], item["path"], item["query"], item["body"])
+                    self._queues[item_key].append(item)
+            queue = self._queues.get(key)
+            if queue:
+                self._last[key] = queue.popleft()
+            item = self._last.get(key)
+            if item is None:
+                self.misses += 1
+            return item
+
+    def stats(self):
+        by_upstream = defaultdict(int)
+        for item in self.interactions:
+            by_upstream[item["upstream"]] += 1
+        return {"interactions": len(self.interactions), "misses": self.misses, **by_upstream}
+
+
+# --------- Record / replay servers ---------
+class CassetteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body are separate writes; avoid 40 ms delayed-ACK stalls
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, content_type, body):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        server = self.server
+        server.count_request()
+
+        if server.mode == "replay":
+            item = server.cassette.next_response(server.upstream, self.command, url.path, url.query, body)
+            if item is None:
+                self._send(400, "application/json", json.dumps({"error": {
+                    "message": f"No recorded response for {self.command} {url.path}", "type": "cassette_miss"}}))
+                return
+            if server.latency == "recorded" and item["latency_ms"]:
+                time.sleep(item["latency_ms"] / 1000)
+            self._send(item["status"], item["content_type"], item["response"])
+            return
+
+        headers = {k: v for k, v in self.headers.items() if k.lower() in FORWARDED_HEADERS}
+        start = time.perf_counter()
+        try:
+            response = server.http.request(self.command, server.origin + self.path, headers=headers,
+                                           content=body.encode("utf-8") if body else None)
+        except httpx.HTTPError as e:
+            self._send(502, "application/json", json.dumps({"error": {"message": f"Upstream unreachable: {e}"}}))
+            return
+        latency = time.perf_counter() - start  # streamed responses are recorded (and replayed) whole
+        content_type = response.headers.get("Content-Type", "application/json")
+        server.cassette.record(server.upstream, self.command, url.path, url.query, body,
+                               response.status_code, content_type, response.text, latency)
+        self._send(response.status_code, content_type, response.text)
+
+    do_GET = _handle
+    do_POST = _handle
+    do_DELETE = _handle  # Responses API: deleting stored conversation state
+
+
+class CassetteServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, upstream, cassette, mode, origin=None, latency="recorded", host="127.0.0.1", port=0):
+        super().__init__((host, port), CassetteHandler)
+        self.upstream = upstream
+        self.cassette = cassette
+        self.mode = mode
+        self.origin = origin
+        self.latency = latency
+        self.http = httpx.Client(timeout=60.0) if mode == "record" else None
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self._count_lock:
+            self.request_count += 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name=f"cassette-{self.upstream}", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.http is not None:
+            self.http.close()
+
+
+class CassetteStack:
+    """One record or replay server per upstream; same interface as stub_servers.StubStack."""
+
+    def __init__(self, cassette, servers, targets, path=None):
+        self.cassette = cassette
+        self.servers = servers
+        self.targets = targets  # upstream -> URL path the examples call
+        self.path = path
+
+    def env(self):
+        """Environment variables that point Ex 1-5 at the servers (replay also sets placeholder API keys)."""
+        env = {UPSTREAMS[name][0]: self.servers[name].url + self.targets[name] for name in self.servers}
+        if self.servers["llm"].mode == "replay":
+            env.update(REPLAY_KEYS)
+        return env
+
+    def request_counts(self):
+        return {name: server.request_count for name, server in self.servers.items()}
+
+    def stop(self):
+        for server in self.servers.values():
+            server.stop()
+        if self.servers["llm"].mode == "record" and self.path:
+            self.cassette.save(self.path)
+
+
+def upstream_urls(overrides=None):
+    """Real upstream URLs: overrides first, then the examples' environment variables, then the public APIs."""
+    overrides = overrides or {}
+    return {name: overrides.get(name) or os.getenv(var) or default for name, (var, default) in UPSTREAMS.items()}
+
+
+def start_recording(path, upstreams=None):
+    """Start recording proxies in front of `upstreams` ({name: URL}); the cassette is saved to `path` on stop()."""
+    cassette = Cassette()
+    servers, targets = {}, {}
+    for name, url in upstream_urls(upstreams).items():
+        parsed = urlparse(url)
+        servers[name] = CassetteServer(name, cassette, "record", origin=f"{parsed.scheme}://{parsed.netloc}").start()
+        targets[name] = parsed.path
+    cassette.meta["targets"] = targets  # replay serves the same paths
+    return CassetteStack(cassette, servers, targets, path)
+
+
+def start_replay(path, latency="recorded"):
+    """Serve the cassette at `path`; latency is "recorded" or "zero"."""
+    cassette = Cassette.load(path)
+    targets = cassette.meta.get("targets") or {name: urlparse(default).path for name, (_, default) in UPSTREAMS.items()}
+    servers = {name: CassetteServer(name, cassette, "replay", latency=latency).start() for name in UPSTREAMS}
+    return CassetteStack(cassette, servers, targets, path)
+
+
+def add_cassette_arguments(parser):
+    """Command-line options shared by the benchmarks that can record or replay cassettes."""
+    parser.add_argument("--record", metavar="CASSETTE", help="proxy the real APIs and record the traffic to this file")
+    parser.add_argument("--replay", metavar="CASSETTE", help="serve the traffic recorded in this file instead of the stand-ins")
+    parser.add_argument("--replay-latency", choices=("recorded", "zero"), default="recorded",
+                        help="replay each response after its recorded latency, or at once")
+    for name in UPSTREAMS:
+        parser.add_argument(f"--{name}-upstream", help=f"record mode: {name} URL (default: ${UPSTREAMS[name][0]} "
+                                                        f"or {UPSTREAMS[name][1]})")
+
+
+def start_cassette_from_args(args):
+    """The record or replay stack the arguments ask for, or None to use the stand-ins."""
+    if args.replay:
+        return start_replay(args.replay, args.replay_latency)
+    if args.record:
+        return start_recording(args.record, {name: getattr(args, f"{name}_upstream") for name in UPSTREAMS})
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or replay the agents' API traffic")
+    parser.add_argument("mode", choices=("record", "replay"))
+    parser.add_argument("cassette", help="cassette file (.gz)")
+    parser.add_argument("--latency", choices=("recorded", "zero"), default="recorded", help="replay latency")
+    for name in UPSTREAMS:
+        parser.add_argument(f"--{name}-upstream", help=f"record mode: {name} URL")
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        stack = start_recording(args.cassette, {name: getattr(args, f"{name}_upstream") for name in UPSTREAMS})
+        print(f"Recording to {args.cassette}. Point the agents at the proxies with:\n")
+    else:
+        stack = start_replay(args.cassette, args.latency)
+        print(f"Replaying {args.cassette} ({stack.cassette.stats()['interactions']} exchanges, "
+              f"{args.latency} latency). Point the agents at it with:\n")
+    for key, value in stack.env().items():
+        print(f"  export {key}={value}")
+    print("\nCtrl+C to stop" + (" and save." if args.mode == "record" else "."))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stack.stop()
+        print(f"\n{stack.cassette.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Throughput and tail-latency load test for the agents, against local stand-ins.
+
+Starts the stand-in servers from stub_servers.py, points the examples at them,
+and drives N simulated users (each with its own conversation) through:
+
+- ex3: Ex 3 run_turn() (raw OpenAI SDK, one thread per user)
+- ex4: Ex 4 run_turn() (raw OpenAI SDK with tool tracking, one thread per user)
+- ex5: Ex 5 LangGraph graph (one asyncio task per user on a single event loop)
+- ex5-fanout: Ex 5 fan-out graph (plan, one branch per location, one synthesis call)
+
+Reported per agent: turns/s and p50/p95/p99 for the whole turn and for each
+stage (LLM decision call, each tool, LLM follow-up call; graph nodes for Ex 5).
+
+Instead of the stand-ins, --record proxies the real APIs into a cassette and
+--replay serves a recorded cassette (see cassettes.py); replaying with
+--replay-latency zero measures only the agents' own CPU work. --save writes the
+results as JSON and --baseline prints the change against an earlier --save.
+
+--rpm/--tpm pace the agents' LLM calls with llm_scheduler.py (a fresh scheduler
+per agent); combine with the stand-in's --llm-rpm-limit/--llm-tpm-limit to
+compare 429s and turn latency with and without client-side scheduling.
+--hedge duplicates LLM and tool calls slower than their observed p95 (hedging.py,
+a fresh hedger per agent) and reports the tail latency it saved.
+
+Usage (from the repository root):
+    python -m benchmarks.load_test --users 20 --turns 5
+    python -m benchmarks.load_test --agents ex3,ex5 --llm-latency lognormal:600,0.7 --llm-error-rate 0.02
+    python -m benchmarks.load_test --users 30 --llm-rpm-limit 300 --llm-tpm-limit 200000 --rpm 280 --tpm 190000
+    python -m benchmarks.load_test --agents ex3,ex5 --users 20 --turns 20 --hedge
+    python -m benchmarks.load_test --replay ci.cassette.gz --replay-latency zero --save new.json --baseline old.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.cassettes import add_cassette_arguments, start_cassette_from_args
+from benchmarks.metrics import LatencyRecorder, print_stage_table
+from benchmarks.stub_servers import add_stub_arguments, start_from_args
+from example_loader import load_example
+from hedging import Hedger, print_hedge_report
+from llm_scheduler import LLMScheduler
+
+# Phrased so the stand-in model recognises the locations (see stub_servers.plan_tool_calls)
+PROMPTS = [
+    "What's the weather in Paris, FR?",
+    "How is the air quality near ZIP 10001?",
+    "Compare the weather in Berlin, DE and weather in Madrid, ES.",
+    "Weather in Chicago, US and the air quality for 60601?",
+    "Tell me a fun fact about clouds.",
+    "Air quality for 94103 and 98101, and weather in Seattle, US.",
+]
+
+TOOL_ERROR_PREFIXES = ("Could not", "Error", "No air quality")
+
+
+def prompt_for(user, turn):
+    return PROMPTS[(user + turn) % len(PROMPTS)]
+
+
+# --------- Raw SDK agents (Ex 3 / Ex 4) ---------
+def instrument_sdk_module(module, recorder):
+    """Wrap the module's chat client and tool functions with stage timers."""
+    create = module.client.chat.completions.create
+
+    def timed_stream(stage, args, kwargs):
+        with recorder.time(stage):  # until the last chunk, not just the response headers
+            yield from create(*args, **kwargs)
+
+    def timed_create(*args, **kwargs):
+        stage = "llm_decision" if kwargs.get("tools") else "llm_followup"
+        if kwargs.get("stream"):
+            return timed_stream(stage, args, kwargs)
+        with recorder.time(stage):
+            return create(*args, **kwargs)
+
+    module.client.chat.completions.create = timed_create
+
+    for name in ("get_current_weather", "get_current_air_quality"):
+        fn = getattr(module, name)
+
+        def timed_tool(*args, _fn=fn, _stage=f"tool:{name}", **kwargs):
+            with recorder.time(_stage):
+                result = _fn(*args, **kwargs)
+            if isinstance(result, str) and result.startswith(TOOL_ERROR_PREFIXES):
+                recorder.error(_stage)
+            return result
+
+        setattr(module, name, timed_tool)
+
+
+def run_sdk_agent(module, users, turns):
+    recorder = LatencyRecorder()
+    instrument_sdk_module(module, recorder)
+
+    def user_session(user):
+        messages = [{"role": "system", "content": module.SYSTEM_PROMPT}]
+        for turn in range(turns):
+            try:
+                with recorder.time("turn"):
+                    module.run_turn(messages, prompt_for(user, turn))
+            except Exception:
+                pass  # counted by recorder.time(); the session continues like chat_agent() does
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user_session, range(users)))
+    return recorder, time.perf_counter() - start
+
+
+# --------- LangGraph agent (Ex 5) ---------
+async def _graph_sessions(module, users, turns, recorder, fanout=False):
+    from langchain_core.messages import HumanMessage
+
+    app, _ = module.create_fanout_agent() if fanout else module.create_weather_agent()
+    system_msg = HumanMessage(content=module.SYSTEM_PROMPT)
+
+    async def user_session(user):
+        for turn in range(turns):
+            state = {"messages": [system_msg, HumanMessage(content=prompt_for(user, turn))], "tools_used": []}
+            config = {"configurable": {"thread_id": f"user-{user}"}}  # the LLM scheduler's session
+            start = last = time.perf_counter()
+            try:
+                async for update in app.astream(state, config, stream_mode="updates"):
+                    now = time.perf_counter()
+                    for node, values in update.items():
+                        recorder.record(f"node:{node}", now - last)
+                        values = values or {}
+                        for message in values.get("messages", []) + values.get("location_results", []):
+                            if message.type == "tool" and str(message.content).startswith(TOOL_ERROR_PREFIXES):
+                                recorder.error(f"node:{node}")
+                    last = now
+            except Exception:
+                recorder.error("turn")
+            recorder.record("turn", time.perf_counter() - start)
+
+    try:
+        await asyncio.gather(*(user_session(user) for user in range(users)))
+    finally:
+        await module.close_http_client()
+
+
+_graph_loop = None
+
+
+def run_graph_agent(module, users, turns, fanout=False):
+    # One event loop for every graph run: langchain_openai caches its async HTTP client
+    # per process, and that client cannot be used from a second loop
+    global _graph_loop
+    if _graph_loop is None:
+        _graph_loop = asyncio.new_event_loop()
+    recorder = LatencyRecorder()
+    start = time.perf_counter()
+    _graph_loop.run_until_complete(_graph_sessions(module, users, turns, recorder, fanout))
+    return recorder, time.perf_counter() - start
+
+
+def run_fanout_agent(module, users, turns):
+    return run_graph_agent(module, users, turns, fanout=True)
+
+
+def print_scheduler_stats(label, stats, upstream_429s=None):
+    print(f"\nLLM scheduler ({label}): max queue depth {stats['max_queue_depth']}, "
+          f"429s seen by the agent {stats['rate_limited_429']}"
+          + (f", 429s sent by the stand-in {upstream_429s}" if upstream_429s is not None else ""))
+    print(f"{'priority':<10} {'calls':>6} {'wait mean':>10} {'p50':>8} {'p95':>8} {'max':>8}")
+    for name in ("followup", "new_turn"):
+        s = stats[name]
+        print(f"{name:<10} {s['calls']:>6} {s['wait_mean_ms']:>10.1f} {s['wait_p50_ms']:>8.1f} "
+              f"{s['wait_p95_ms']:>8.1f} {s['wait_max_ms']:>8.1f}")
+
+
+def save_results(path, args, results):
+    """Write the per-agent results as JSON for a later --baseline comparison."""
+    report = {
+        "users": args.users,
+        "turns": args.turns,
+        "agents": {
+            label: {"wall_s": wall, "turns_per_s": summary.get("turn", {}).get("count", 0) / wall if wall else 0.0,
+                    "stages": summary, "upstream_calls": calls}
+            for label, wall, summary, calls in results
+        },
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+
+def print_baseline_diff(path, results):
+    """Change in throughput and turn latency against a file written by --save."""
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)["agents"]
+
+    def change(new, old):
+        return f"{(new - old) / old:+.1%}" if old else "n/a"
+
+    print(f"\nChange against {path}")
+    print(f"{'agent':<26} {'turns/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    print("-" * 66)
+    for label, wall, summary, _ in results:
+        old = baseline.get(label)
+        if old is None:
+            print(f"{label:<26} (not in baseline)")
+            continue
+        turn, old_turn = summary.get("turn", {}), old["stages"].get("turn", {})
+        rate = turn.get("count", 0) / wall if wall else 0.0
+        print(f"{label:<26} {change(rate, old['turns_per_s']):>9} "
+              + " ".join(f"{change(turn.get(p, 0), old_turn.get(p, 0)):>9}" for p in ("p50", "p95", "p99")))
+
+
+AGENTS = {
+    "ex3": ("Ex 3 raw SDK", 3, run_sdk_agent),
+    "ex4": ("Ex 4 raw SDK + tracking", 4, run_sdk_agent),
+    "ex5": ("Ex 5 LangGraph", 5, run_graph_agent),
+    "ex5-fanout": ("Ex 5 LangGraph fan-out", 5, run_fanout_agent),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the agents against local stand-ins")
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=5, help="turns per user")
+    parser.add_argument("--agents", default="ex3,ex4,ex5", help="comma-separated subset of ex3, ex4, ex5, ex5-fanout")
+    parser.add_argument("--no-cache", action="store_true", help="disable the tool result cache (TOOL_CACHE=off)")
+    parser.add_argument("--stream-tool-calls", action="store_true",
+                        help="Ex 3/4: stream the tool decision and start tools early (STREAM_TOOL_CALLS=on)")
+    parser.add_argument("--rpm", type=float, default=0, help="pace LLM calls to this many requests per minute")
+    parser.add_argument("--tpm", type=float, default=0, help="pace LLM calls to this many tokens per minute")
+    parser.add_argument("--hedge", action="store_true", help="hedge LLM and tool calls slower than their observed p95")
+    parser.add_argument("--hedge-budget", type=float, default=0.05, help="max fraction of extra requests from hedging")
+    parser.add_argument("--save", metavar="JSON", help="write the results to this file")
+    parser.add_argument("--baseline", metavar="JSON", help="compare against results written by --save")
+    add_stub_arguments(parser)
+    add_cassette_arguments(parser)
+    args = parser.parse_args()
+
+    stack = start_cassette_from_args(args) or start_from_args(args)
+    os.environ.update(stack.env())
+    if args.no_cache:
+        os.environ["TOOL_CACHE"] = "off"
+    if args.stream_tool_calls:
+        os.environ["STREAM_TOOL_CALLS"] = "on"
+
+    results = []
+    try:
+        for key in [a.strip() for a in args.agents.split(",") if a.strip()]:
+            label, number, runner = AGENTS[key]
+            module = load_example(number)
+            if args.rpm or args.tpm:
+                module.llm_scheduler = LLMScheduler(rpm=args.rpm, tpm=args.tpm)
+            if args.hedge:
+                module.hedger = Hedger(budget=args.hedge_budget)
+            limiter = getattr(getattr(stack, "llm", None), "rate_limiter", None)
+            if limiter:
+                limiter.reset()  # each agent starts with the stand-in's full budget, like its fresh scheduler
+            rejected_before = limiter.rejected if limiter else None
+            before = stack.request_counts()
+            # The examples print progress for every tool call; keep the report readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                recorder, wall = runner(module, args.users, args.turns)
+            after = stack.request_counts()
+            summary = recorder.summary()
+            results.append((label, wall, summary, {k: after[k] - before[k] for k in after}))
+            print_stage_table(f"{label}: {args.users} users x {args.turns} turns in {wall:.2f}s "
+                              f"(latencies in ms)", summary)
+            if module.llm_scheduler.enabled:
+                print_scheduler_stats(label, module.llm_scheduler.stats(),
+                                      limiter.rejected - rejected_before if limiter else None)
+            elif limiter:
+                print(f"\n429s sent by the stand-in: {limiter.rejected - rejected_before}")
+            print_hedge_report(module.hedger.stats())
+    finally:
+        stack.stop()
+
+    print("\nComparison")
+    print(f"{'agent':<26} {'turns':>6} {'errors':>6} {'turns/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'upstream calls':>16}")
+    print("-" * 92)
+    for label, wall, summary, calls in results:
+        turn = summary.get("turn", {"count": 0, "errors": 0, "p50": 0, "p95": 0, "p99": 0})
+        upstream = f"{calls['llm']}/{calls['openweather']}/{calls['airnow']}"
+        print(f"{label:<26} {turn['count']:>6} {turn['errors']:>6} {turn['count'] / wall:>8.2f} "
+              f"{turn['p50']:>8.1f} {turn['p95']:>8.1f} {turn['p99']:>8.1f} {upstream:>16}")
+    print("(upstream calls = LLM/OpenWeather/AirNow requests, including SDK retries)")
+    if args.replay or args.record:
+        print(f"Cassette {args.replay or args.record}: {stack.cassette.stats()}")
+
+    if args.save:
+        save_results(args.save, args, results)
+    if args.baseline:
+        print_baseline_diff(args.baseline, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Latency recording and percentile reporting shared by the benchmarks."""
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(pct / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+class LatencyRecorder:
+    """Thread-safe per-stage latency samples and error counts."""
+
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    def error(self, stage):
+        with self._lock:
+            self._errors[stage] += 1
+
+    @contextmanager
+    def time(self, stage):
+        """Time the block as `stage`; exceptions are counted as errors for that stage and re-raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.error(stage)
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def count(self, stage):
+        with self._lock:
+            return len(self._samples.get(stage, ()))
+
+    def summary(self):
+        """{stage: {count, errors, mean, p50, p95, p99, max}} with latencies in milliseconds."""
+        with self._lock:
+            stages = sorted(set(self._samples) | set(self._errors))
+            samples = {stage: sorted(self._samples.get(stage, ())) for stage in stages}
+            errors = dict(self._errors)
+
+        result = {}
+        for stage in stages:
+            values = samples[stage]
+            result[stage] = {
+                "count": len(values),
+                "errors": errors.get(stage, 0),
+                "mean": 1000 * sum(values) / len(values) if values else 0.0,
+                "p50": 1000 * percentile(values, 50),
+                "p95": 1000 * percentile(values, 95),
+                "p99": 1000 * percentile(values, 99),
+                "max": 1000 * values[-1] if values else 0.0,
+            }
+        return result
+
+
+def print_stage_table(title, summary):
+    print(f"\n{title}")
+    print(f"{'stage':<34} {'count':>6} {'errors':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    print("-" * 92)
+    for stage, s in summary.items():
+        print(f"{stage:<34} {s['count']:>6} {s['errors']:>6} {s['mean']:>8.1f} {s['p50']:>8.1f} "
+              f"{s['p95']:>8.1f} {s['p99']:>8.1f} {s['max']:>8.1f}")
@@ -0,0 +1,786 @@
+"""
+Local stand-ins for the OpenAI chat completions API, OpenWeather and AirNow.
+
+Each stand-in is a small threaded HTTP server with its own latency
+distribution and error rate, so the agents can be load-tested without
+spending API money or hitting upstream rate limits.
+
+The chat stand-in understands just enough of the conversation to drive the
+weather/air-quality agents: when tools are offered and the last message is
+from the user, it calls get_current_weather for every "weather in <City>, <CC>"
+and get_current_air_quality for every 5-digit ZIP code it finds; otherwise it
+answers with a short text reply.
+
+The chat stand-in also serves the Files and Batch APIs (upload a JSONL file,
+create a batch, poll it, download the output file). A batch completes
+--batch-delay seconds after it is created; every request in it then gets the
+same reply the chat endpoint would give, with the chat error rate applied per
+request.
+
+With "stream": true the chat stand-in answers with server-sent events the way
+the real API does: text and tool-call arguments arrive in small fragments,
+--stream-chunk-ms apart, after the usual first-byte latency. Non-streamed
+replies wait for the same generation time before they are sent.
+
+The chat stand-in also serves the Responses API with stored conversation
+state: a response created with store=true can be continued by sending only
+the new input plus previous_response_id. Stored responses expire after
+--response-ttl seconds (or on DELETE), after which continuing from them fails
+with the same 400 error the real API returns.
+
+--llm-rpm-limit / --llm-tpm-limit make the chat stand-in enforce per-minute
+request and token budgets like the real API (prompt tokens plus max_tokens,
+replenished continuously): calls over budget get a 429 with Retry-After.
+
+Latency specs (milliseconds):
+    fixed:MS                e.g. fixed:50
+    uniform:LO,HI           e.g. uniform:20,120
+    lognormal:MEDIAN,SIGMA  e.g. lognormal:400,0.5 (long right tail, like real APIs)
+    exp:MEAN                e.g. exp:80
+    stall:MEDIAN,SIGMA,STALL,FRACTION
+                            e.g. stall:400,0.3,5000,0.02 (lognormal, plus a STALL ms
+                            delay for a FRACTION of requests, like an overloaded backend)
+
+Run standalone (prints the environment variables that point the agents at it):
+    python -m benchmarks.stub_servers --llm-latency lognormal:400,0.5 --tool-latency lognormal:120,0.6
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import zlib
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+WEATHER_PATTERN = re.compile(r"weather in ([A-Z][\w .'-]*?),\s*([A-Z]{2})\b", re.IGNORECASE)
+ZIP_PATTERN = re.compile(r"\b(\d{5})\b")
+
+DESCRIPTIONS = ["clear sky", "few clouds", "scattered clouds", "broken clouds", "light rain", "overcast clouds"]
+CATEGORIES = [(50, "Good"), (100, "Moderate"), (150, "Unhealthy for Sensitive Groups"), (200, "Unhealthy")]
+
+
+# --------- Latency and errors ---------
+class LatencyModel:
+    """Samples response delays (in seconds) from a spec string such as 'lognormal:400,0.5'."""
+
+    def __init__(self, spec="fixed:0", rng=None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, _, params = spec.partition(":")
+        values = [float(v) for v in params.split(",") if v.strip()] or [0.0]
+        if kind == "fixed":
+            self._sample = lambda: values[0]
+        elif kind == "uniform":
+            self._sample = lambda: self.rng.uniform(values[0], values[1])
+        elif kind == "lognormal":
+            mu, sigma = math.log(max(values[0], 1e-3)), values[1] if len(values) > 1 else 0.5
+            self._sample = lambda: self.rng.lognormvariate(mu, sigma)
+        elif kind == "exp":
+            self._sample = lambda: self.rng.expovariate(1 / max(values[0], 1e-3))
+        elif kind == "stall" and len(values) == 4:
+            mu, sigma, stall, fraction = math.log(max(values[0], 1e-3)), values[1], values[2], values[3]
+            self._sample = lambda: self.rng.lognormvariate(mu, sigma) + (stall if self.rng.random() < fraction else 0.0)
+        else:
+            raise ValueError(f"Unknown latency spec '{spec}' (use fixed, uniform, lognormal, exp or stall)")
+
+    def sample(self) -> float:
+        return max(self._sample(), 0.0) / 1000
+
+
+class StubProfile:
+    """Latency distribution and error injection for one stand-in server."""
+
+    def __init__(self, latency="fixed:0", error_rate=0.0, error_status=500, seed=None):
+        self.rng = random.Random(seed)
+        self.latency = LatencyModel(latency, self.rng)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._lock = threading.Lock()
+
+    def next_outcome(self):
+        """Return (delay seconds, error status or None) for the next request."""
+        with self._lock:
+            delay = self.latency.sample()
+            failed = self.rng.random() < self.error_rate
+        return delay, (self.error_status if failed else None)
+
+
+# --------- Response builders ---------
+class RateLimiter:
+    """Per-minute request and token budgets, replenished continuously like the real API's."""
+
+    def __init__(self, rpm=0, tpm=0):
+        self.limits = {"requests": rpm, "tokens": tpm}
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Refill both budgets (a fresh minute)."""
+        self.levels = dict(self.limits)
+        self.updated = time.monotonic()
+
+    def admit(self, tokens):
+        """Charge one request of `tokens`; return None, or the seconds to wait if it is over budget."""
+        cost = {"requests": 1, "tokens": tokens}
+        with self._lock:
+            now = time.monotonic()
+            for key, limit in self.limits.items():
+                if limit:
+                    self.levels[key] = min(limit, self.levels[key] + (now - self.updated) * limit / 60)
+            self.updated = now
+            waits = [(min(cost[key], limit) - self.levels[key]) * 60 / limit
+                     for key, limit in self.limits.items() if limit and self.levels[key] < min(cost[key], limit)]
+            if waits:
+                self.rejected += 1
+                return max(waits)
+            for key, limit in self.limits.items():
+                if limit:
+                    self.levels[key] -= cost[key]
+            return None
+
+
+def _stable_int(text, modulo):
+    return zlib.crc32(text.encode("utf-8")) % modulo
+
+
+def _estimate_tokens(payload) -> int:
+    return len(json.dumps(payload, ensure_ascii=False)) // 4 + 1
+
+
+def _text_of(message):
+    content = message.get("content")
+    if isinstance(content, list):  # content parts
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def plan_tool_calls(text, tool_names):
+    """Tool calls the stand-in model makes for a user message."""
+    calls = []
+    if "get_current_weather" in tool_names:
+        for city, country in WEATHER_PATTERN.findall(text):
+            calls.append(("get_current_weather", {"city": city.strip(), "country": country.upper(), "units": "metric"}))
+    if "get_current_air_quality" in tool_names:
+        for zip_code in ZIP_PATTERN.findall(text):
+            calls.append(("get_current_air_quality", {"zip_code": zip_code}))
+    return calls
+
+
+def reply_text(messages):
+    """Final answer: echo the tool results the model has just received, or acknowledge the question."""
+    results = []
+    for message in reversed(messages):
+        if message.get("role") != "tool":
+            break
+        results.append(_text_of(message))
+    if results:
+        return "Here is what I found: " + "; ".join(reversed(results))
+    return f"(stub) You said: {_text_of(messages[-1])[:200]}"
+
+
+def chat_completion(body):
+    """Build an OpenAI chat.completion object for a request body."""
+    messages = body.get("messages", [])
+    tool_names = {t.get("function", {}).get("name") for t in body.get("tools") or []}
+    last = messages[-1] if messages else {}
+
+    calls = plan_tool_calls(_text_of(last), tool_names) if last.get("role") == "user" else []
+    if calls:
+        message = {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {"name": name, "arguments": json.dumps(args)},
+                }
+                for name, args in calls
+            ],
+        }
+        finish_reason = "tool_calls"
+    else:
+        message = {"role": "assistant", "content": reply_text(messages)}
+        finish_reason = "stop"
+
+    prompt_tokens = _estimate_tokens(messages)
+    completion_tokens = _estimate_tokens(message)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub-model"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason, "logprobs": None}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def completion_chunks(completion, piece=8, include_usage=False):
+    """Split a chat.completion object into the chat.completion.chunk objects of a streamed response."""
+    choice = completion["choices"][0]
+    message = choice["message"]
+    base = {"id": completion["id"], "object": "chat.completion.chunk",
+            "created": completion["created"], "model": completion["model"]}
+    if include_usage:  # stream_options={"include_usage": true}: usage is null until a last, choice-less chunk
+        base["usage"] = None
+
+    def chunk(delta, finish_reason=None):
+        return {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}]}
+
+    yield chunk({"role": "assistant", "content": "" if message.get("content") is not None else None})
+    text = message.get("content") or ""
+    for start in range(0, len(text), piece):
+        yield chunk({"content": text[start:start + piece]})
+    for index, call in enumerate(message.get("tool_calls") or ()):
+        yield chunk({"tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                                     "function": {"name": call["function"]["name"], "arguments": ""}}]})
+        arguments = call["function"]["arguments"]
+        for start in range(0, len(arguments), piece):
+            yield chunk({"tool_calls": [{"index": index, "function": {"arguments": arguments[start:start + piece]}}]})
+    yield chunk({}, choice["finish_reason"])
+    if include_usage:
+        yield {**base, "choices": [], "usage": completion["usage"]}
+
+
+def openweather_observation(query):
+    """OpenWeather /data/2.5/weather payload for q=City,CC (stable per location)."""
+    q = query.get("q", [""])[0]
+    units = query.get("units", ["metric"])[0]
+    seed = _stable_int(q.lower(), 10_000)
+    temp_c = (seed % 400) / 10 - 5
+    temp = temp_c * 9 / 5 + 32 if units == "imperial" else temp_c
+    city, _, country = q.partition(",")
+    return {
+        "name": city,
+        "sys": {"country": country},
+        "weather": [{"description": DESCRIPTIONS[seed % len(DESCRIPTIONS)]}],
+        "main": {"temp": round(temp, 2), "feels_like": round(temp - 1.3, 2), "humidity": 30 + seed % 65},
+        "wind": {"speed": round((seed % 120) / 10, 2)},
+        "cod": 200,
+    }
+
+
+def airnow_observations(query):
+    """AirNow current observations payload for zipCode=NNNNN."""
+    zip_code = query.get("zipCode", [""])[0]
+    aqi = 10 + _stable_int(zip_code, 170)
+    category = next((name for limit, name in CATEGORIES if aqi <= limit), "Very Unhealthy")
+    return [{
+        "DateObserved": time.strftime("%Y-%m-%d "),
+        "HourObserved": time.localtime().tm_hour,
+        "ReportingArea": f"Area {zip_code}",
+        "ParameterName": "PM2.5" if aqi % 2 else "O3",
+        "AQI": aqi,
+        "Category": {"Number": 1, "Name": category},
+    }]
+
+
+# --------- Files and Batch API ---------
+class BatchStore:
+    """In-memory Files and Batches API; a batch completes `delay` seconds after it is created."""
+
+    def __init__(self, profile, delay=2.0):
+        self.profile = profile
+        self.delay = delay
+        self.files = {}  # id -> (file object, bytes)
+        self.batches = {}
+        self._lock = threading.Lock()
+
+    def add_file(self, filename, purpose, data):
+        file_object = {
+            "id": f"file-{uuid.uuid4().hex[:24]}",
+            "object": "file",
+            "bytes": len(data),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        with self._lock:
+            self.files[file_object["id"]] = (file_object, data)
+        return file_object
+
+    def file_content(self, file_id):
+        with self._lock:
+            entry = self.files.get(file_id)
+        return entry[1] if entry else None
+
+    def create_batch(self, body):
+        """Return the new batch object, or None if the input file does not exist."""
+        if self.file_content(body.get("input_file_id", "")) is None:
+            return None
+        now = int(time.time())
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex[:24]}",
+            "object": "batch",
+            "endpoint": body.get("endpoint", "/v1/chat/completions"),
+            "errors": None,
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": now,
+            "in_progress_at": None,
+            "expires_at": now + 24 * 3600,
+            "completed_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": body.get("metadata"),
+        }
+        with self._lock:
+            self.batches[batch["id"]] = batch
+        return dict(batch)
+
+    def get_batch(self, batch_id):
+        """The batch object, advanced to in_progress/completed as time passes."""
+        with self._lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            elapsed = time.time() - batch["created_at"]
+            if batch["status"] == "validating" and elapsed >= min(0.5, self.delay):
+                batch["status"] = "in_progress"
+                batch["in_progress_at"] = int(time.time())
+            if batch["status"] == "in_progress" and elapsed >= self.delay:
+                self._complete(batch)
+            return dict(batch)
+
+    def _complete(self, batch):
+        """Run every request of the batch (caller holds the lock)."""
+        lines = [json.loads(line) for line in self.files[batch["input_file_id"]][1].decode("utf-8").splitlines()
+                 if line.strip()]
+        output = []
+        failed = 0
+        for line in lines:
+            _, error_status = self.profile.next_outcome()
+            if error_status:
+                failed += 1
+                status, body = error_status, {"error": {"message": "Injected stub error", "type": "server_error"}}
+            else:
+                status, body = 200, chat_completion(line.get("body", {}))
+            output.append({
+                "id": f"batch_req_{uuid.uuid4().hex[:24]}",
+                "custom_id": line.get("custom_id"),
+                "response": {"status_code": status, "request_id": uuid.uuid4().hex, "body": body},
+                "error": None,
+            })
+        data = "".join(json.dumps(item) + "\n" for item in output).encode("utf-8")
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        self.files[file_id] = ({"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                                "filename": f"{batch['id']}_output.jsonl", "purpose": "batch_output",
+                                "status": "processed"}, data)
+        batch.update(
+            status="completed",
+            output_file_id=file_id,
+            completed_at=int(time.time()),
+            request_counts={"total": len(lines), "completed": len(lines) - failed, "failed": failed},
+        )
+
+
+# --------- HTTP server ---------
+def response_object(body, context, reply):
+    """Build an OpenAI Responses API response object; `context` is every message the model saw."""
+    input_tokens = _estimate_tokens(context)  # the whole conversation is processed, even if only new input was sent
+    output_tokens = _estimate_tokens(reply)
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model", "stub-model"),
+        "status": "completed",
+        "instructions": body.get("instructions"),
+        "previous_response_id": body.get("previous_response_id"),
+        "output": [{
+            "type": "message",
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "status": "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": reply, "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "store": body.get("store", True),
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
+
+
+class ResponseStore:
+    """Stored Responses API conversations (the messages each response has seen, plus its reply), with a TTL."""
+
+    def __init__(self, ttl=3600.0):
+        self.ttl = ttl
+        self._context = {}  # response id -> (expires at, messages)
+        self._lock = threading.Lock()
+
+    def context(self, response_id):
+        """The conversation up to and including `response_id`, or None if it is unknown or expired."""
+        with self._lock:
+            entry = self._context.get(response_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._context[response_id]
+                return None
+            return entry[1]
+
+    def save(self, response_id, messages):
+        with self._lock:
+            self._context[response_id] = (time.monotonic() + self.ttl, messages)
+
+    def delete(self, response_id):
+        with self._lock:
+            return self._context.pop(response_id, None) is not None
+
+
+def _input_messages(body):
+    """The Responses API `input` (a string or a list of messages) as chat-style messages."""
+    items = body.get("input") or []
+    if isinstance(items, str):
+        return [{"role": "user", "content": items}]
+    return [item for item in items if isinstance(item, dict) and item.get("role")]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    disable_nagle_algorithm = True  # headers and body are separate writes; avoid 40 ms delayed-ACK stalls
+
+    def log_message(self, format, *args):  # keep benchmark output clean
+        pass
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_rate_limited(self, retry_after):
+        data = json.dumps({"error": {"message": "Rate limit reached (stand-in)", "type": "requests",
+                                     "code": "rate_limit_exceeded"}}).encode("utf-8")
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Retry-After", f"{retry_after:.3f}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_stream(self, chunks, delay):
+        """Send chunks as server-sent events (chunked transfer encoding, so keep-alive still works)."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for item in [*(json.dumps(c) for c in chunks), "[DONE]"]:
+            event = f"data: {item}\n\n".encode("utf-8")
+            data = f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n"
+            if item == "[DONE]":
+                data += b"0\r\n\r\n"  # end of body in the same write, so the client can reuse the connection
+            self.wfile.write(data)
+            self.wfile.flush()
+            if delay and item != "[DONE]":
+                time.sleep(delay)
+
+    def _read_form(self):
+        """Parse a multipart/form-data body into {field: (filename, bytes)}."""
+        length = int(self.headers.get("Content-Length") or 0)
+        head = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("latin-1")
+        message = BytesParser(policy=HTTP).parsebytes(head + self.rfile.read(length))
+        return {
+            part.get_param("name", header="content-disposition"): (part.get_filename(), part.get_payload(decode=True))
+            for part in message.iter_parts()
+        }
+
+    def _batch_api(self, method, path):
+        """Serve the Files and Batch API routes; return False if `path` is not one of them."""
+        store = self.server.batch_store
+        if store is None or not re.search(r"/(files|batches)(/|$)", path):
+            return False
+        self.server.count_request()
+        not_found = {"error": {"message": f"No such object: {path}", "type": "invalid_request_error"}}
+        if method == "POST" and path.endswith("/files"):
+            form = self._read_form()
+            filename, data = form.get("file", ("upload.jsonl", b""))
+            purpose = (form.get("purpose", (None, b"batch"))[1] or b"batch").decode("utf-8")
+            self._send_json(200, store.add_file(filename, purpose, data))
+        elif method == "POST" and path.endswith("/batches"):
+            batch = store.create_batch(self._read_json())
+            self._send_json(200 if batch else 400, batch or not_found)
+        elif method == "GET" and path.endswith("/content"):
+            data = store.file_content(path.rstrip("/").split("/")[-2])
+            if data is None:
+                self._send_json(404, not_found)
+                return True
+            self.send_response(200)
+            self.send_header("Content-Type", "application/jsonl")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif method == "GET" and "/batches/" in path:
+            batch = store.get_batch(path.rstrip("/").split("/")[-1])
+            self._send_json(200 if batch else 404, batch or not_found)
+        else:
+            self._send_json(404, not_found)
+        return True
+
+    def _responses_api(self, method, path):
+        """Serve the Responses API routes; return False if `path` is not one of them."""
+        store = self.server.response_store
+        if store is None or not re.search(r"/responses(/|$)", path):
+            return False
+        if method == "DELETE":
+            self.server.count_request()
+            response_id = path.rstrip("/").split("/")[-1]
+            if store.delete(response_id):
+                self._send_json(200, {"id": response_id, "object": "response", "deleted": True})
+            else:
+                self._send_json(404, {"error": {"message": f"No response with id '{response_id}'.",
+                                                "type": "invalid_request_error"}})
+            return True
+
+        body = self._read_json()
+        context = []
+        previous = body.get("previous_response_id")
+        if previous:
+            context = store.context(previous)
+            if context is None:
+                self.server.count_request()
+                self._send_json(400, {"error": {"message": f"Previous response with id '{previous}' not found.",
+                                                "type": "invalid_request_error", "param": "previous_response_id",
+                                                "code": "previous_response_not_found"}})
+                return True
+        messages = context + _input_messages(body)
+        error_status = self._simulate()
+        if error_status:
+            self._send_json(error_status, {"error": {"message": "Injected stub error", "type": "server_error", "code": None}})
+            return True
+        reply = reply_text(messages)
+        response = response_object(body, messages, reply)
+        time.sleep(len(reply) / 8 * self.server.stream_chunk_delay)  # the same generation time as a chat reply
+        if body.get("store", True):
+            store.save(response["id"], messages + [{"role": "assistant", "content": reply}])
+        self._send_json(200, response)
+        return True
+
+    def _simulate(self):
+        """Apply the profile's delay; return an error status to send instead of a result, if any."""
+        delay, error_status = self.server.profile.next_outcome()
+        self.server.count_request()
+        if delay:
+            time.sleep(delay)
+        return error_status
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if self._batch_api("POST", path) or self._responses_api("POST", path):
+            return
+        body = self._read_json()
+        if not path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {path}", "type": "invalid_request_error"}})
+            return
+        limiter = self.server.rate_limiter
+        if limiter is not None:
+            retry_after = limiter.admit(_estimate_tokens(body.get("messages")) + (body.get("max_tokens") or 0))
+            if retry_after is not None:
+                self.server.count_request()
+                self._send_rate_limited(retry_after)
+                return
+        error_status = self._simulate()
+        if error_status:
+            self._send_json(error_status, {"error": {"message": "Injected stub error", "type": "server_error", "code": None}})
+            return
+        completion = chat_completion(body)
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        chunks = list(completion_chunks(completion, include_usage=include_usage))
+        if body.get("stream"):
+            self._send_stream(chunks, self.server.stream_chunk_delay)
+            return
+        time.sleep(len(chunks) * self.server.stream_chunk_delay)  # the same generation time, all at once
+        self._send_json(200, completion)
+
+    def do_DELETE(self):
+        path = urlparse(self.path).path
+        if not self._responses_api("DELETE", path):
+            self._send_json(404, {"error": {"message": f"Unknown path {path}", "type": "invalid_request_error"}})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if self._batch_api("GET", url.path):
+            return
+        if url.path.endswith("/weather"):
+            build = openweather_observation
+            error_payload = {"cod": 500, "message": "Injected stub error"}
+        elif "/observation/zipCode/current" in url.path:
+            build = airnow_observations
+            error_payload = {"message": "Injected stub error"}
+        else:
+            self._send_json(404, {"message": f"Unknown path {url.path}"})
+            return
+        error_status = self._simulate()
+        if error_status:
+            self._send_json(error_status, error_payload)
+            return
+        self._send_json(200, build(query))
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, profile, host="127.0.0.1", port=0, batch_store=None, stream_chunk_delay=0.0, rate_limiter=None,
+                 response_store=None):
+        super().__init__((host, port), StubHandler)
+        self.profile = profile
+        self.response_store = response_store
+        self.rate_limiter = rate_limiter
+        self.batch_store = batch_store
+        self.stream_chunk_delay = stream_chunk_delay
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle_error(self, request, client_address):
+        """Clients closing their keep-alive connection are normal; anything else is reported."""
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count_request(self):
+        with self._count_lock:
+            self.request_count += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name=f"stub-{self.url}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubStack:
+    """The three stand-ins (chat LLM, OpenWeather, AirNow) running together."""
+
+    def __init__(self, llm, weather, airnow):
+        self.llm = llm
+        self.weather = weather
+        self.airnow = airnow
+
+    def env(self):
+        """Environment variables that point Ex 1-5 at the stand-ins."""
+        return {
+            "OPENAI_API_KEY": "stub-key",
+            "OPENAI_BASE_URL": f"{self.llm.url}/v1",
+            "OPENWEATHER_API_KEY": "stub-key",
+            "OPENWEATHER_URL": f"{self.weather.url}/data/2.5/weather",
+            "AIRNOW_API_KEY": "stub-key",
+            "AIRNOW_URL": f"{self.airnow.url}/aq/observation/zipCode/current/",
+        }
+
+    def request_counts(self):
+        return {
+            "llm": self.llm.request_count,
+            "openweather": self.weather.request_count,
+            "airnow": self.airnow.request_count,
+        }
+
+    def stop(self):
+        for server in (self.llm, self.weather, self.airnow):
+            server.stop()
+
+
+def start_stub_servers(llm_latency="fixed:0", weather_latency="fixed:0", airnow_latency="fixed:0",
+                       llm_error_rate=0.0, tool_error_rate=0.0, llm_error_status=500, seed=None, batch_delay=2.0,
+                       stream_chunk_ms=15.0, llm_rpm_limit=0, llm_tpm_limit=0, response_ttl=3600.0):
+    """Start all three stand-ins on free local ports and return the running StubStack."""
+    llm_profile = StubProfile(llm_latency, llm_error_rate, llm_error_status, seed)
+    rate_limiter = RateLimiter(llm_rpm_limit, llm_tpm_limit) if llm_rpm_limit or llm_tpm_limit else None
+    return StubStack(
+        llm=StubServer(llm_profile, batch_store=BatchStore(llm_profile, batch_delay),
+                       stream_chunk_delay=stream_chunk_ms / 1000, rate_limiter=rate_limiter,
+                       response_store=ResponseStore(response_ttl)).start(),
+        weather=StubServer(StubProfile(weather_latency, tool_error_rate, 500, seed)).start(),
+        airnow=StubServer(StubProfile(airnow_latency, tool_error_rate, 500, seed)).start(),
+    )
+
+
+def add_stub_arguments(parser):
+    """Command-line options shared by every benchmark that starts the stand-ins."""
+    parser.add_argument("--llm-latency", default="lognormal:400,0.5", help="chat completion latency spec")
+    parser.add_argument("--tool-latency", default="lognormal:120,0.6", help="OpenWeather and AirNow latency spec")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of chat calls that fail")
+    parser.add_argument("--llm-error-status", type=int, default=500, help="HTTP status for failed chat calls (e.g. 429)")
+    parser.add_argument("--tool-error-rate", type=float, default=0.0, help="fraction of tool calls that fail")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for latency and error sampling")
+    parser.add_argument("--batch-delay", type=float, default=2.0, help="seconds until a stand-in batch job completes")
+    parser.add_argument("--stream-chunk-ms", type=float, default=15.0, help="delay between streamed response chunks")
+    parser.add_argument("--response-ttl", type=float, default=3600.0, help="seconds a stored Responses API response lives")
+    parser.add_argument("--llm-rpm-limit", type=float, default=0, help="chat requests per minute before 429s (0 = no limit)")
+    parser.add_argument("--llm-tpm-limit", type=float, default=0, help="chat tokens per minute before 429s (0 = no limit)")
+
+
+def start_from_args(args):
+    return start_stub_servers(
+        llm_latency=args.llm_latency,
+        weather_latency=args.tool_latency,
+        airnow_latency=args.tool_latency,
+        llm_error_rate=args.llm_error_rate,
+        tool_error_rate=args.tool_error_rate,
+        llm_error_status=args.llm_error_status,
+        seed=args.seed,
+        batch_delay=args.batch_delay,
+        stream_chunk_ms=args.stream_chunk_ms,
+        llm_rpm_limit=args.llm_rpm_limit,
+        llm_tpm_limit=args.llm_tpm_limit,
+        response_ttl=args.response_ttl,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the local OpenAI/OpenWeather/AirNow stand-ins")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    stack = start_from_args(args)
+    print("Stand-ins running. Point the agents at them with:\n")
+    for key, value in stack.env().items():
+        print(f"  export {key}={value}")
+    print("\nCtrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stack.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Persistent tool-result store shared by every agent process on the machine.
+
+SQLite in WAL mode: any number of processes can read while one writes, reads
+never block on writers, and committed entries survive restarts. Reads go
+through a memory-mapped database file and a primary-key lookup, so a hit costs
+tens of microseconds, far less than an upstream round-trip.
+
+ToolCache (tool_cache.py) uses this as a second tier behind its in-process
+dictionary: a miss in memory checks the disk before calling the upstream, and
+every fetched or refreshed result is written through. Entries carry their own
+expiry, so all processes agree on when a result goes stale.
+
+Enable by pointing TOOL_CACHE_DB at a file (e.g. TOOL_CACHE_DB=.tool_cache.sqlite).
+TOOL_CACHE_DB_MAX_MB (default 64) caps the total size of stored results. The
+cap is checked on every write against a running byte total kept by triggers;
+past it, expired entries are deleted first, then those closest to expiry.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tool_results (
+    namespace  TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    size       INTEGER NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tool_results_expiry ON tool_results (expires_at);
+CREATE TABLE IF NOT EXISTS store_size (
+    id    INTEGER PRIMARY KEY CHECK (id = 0),
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO store_size (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM tool_results;
+CREATE TRIGGER IF NOT EXISTS tool_results_size_insert AFTER INSERT ON tool_results
+BEGIN UPDATE store_size SET bytes = bytes + NEW.size WHERE id = 0; END;
+CREATE TRIGGER IF NOT EXISTS tool_results_size_update AFTER UPDATE ON tool_results
+BEGIN UPDATE store_size SET bytes = bytes + NEW.size - OLD.size WHERE id = 0; END;
+CREATE TRIGGER IF NOT EXISTS tool_results_size_delete AFTER DELETE ON tool_results
+BEGIN UPDATE store_size SET bytes = bytes - OLD.size WHERE id = 0; END;
+"""
+
+
+class DiskStore:
+    """SQLite-backed (namespace, key) -> value store with expiry and a size cap."""
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, busy_timeout_ms=2000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        """This thread's connection (sqlite3 connections must not be shared between threads)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; a crash loses at most recent cache writes
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            conn.execute(f"PRAGMA mmap_size={self.max_bytes * 2}")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _encode_key(key):
+        return json.dumps(key, separators=(",", ":"))
+
+    def get(self, namespace, key, now=None, grace=0.0):
+        """Return (value, fetched_at, expires_at), or None if absent or expired more than `grace` seconds ago."""
+        now = now if now is not None else time.time()
+        try:
+            row = self._connect().execute(
+                "SELECT value, fetched_at, expires_at FROM tool_results WHERE namespace = ? AND key = ?",
+                (namespace, self._encode_key(key)),
+            ).fetchone()
+        except sqlite3.Error:
+            return None  # the cache is an optimisation; never fail a tool call over it
+        if row is None or now >= row[2] + grace:
+            return None
+        return row
+
+    def put(self, namespace, key, value, fetched_at, expires_at):
+        """Store a result unless a newer one for the same key is already there; evict if it breaks the cap."""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                """
+                INSERT INTO tool_results (namespace, key, value, fetched_at, expires_at, size)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (namespace, key) DO UPDATE SET
+                    value = excluded.value,
+                    fetched_at = excluded.fetched_at,
+                    expires_at = excluded.expires_at,
+                    size = excluded.size
+                WHERE excluded.fetched_at > tool_results.fetched_at
+                """,
+                (namespace, self._encode_key(key), value, fetched_at, expires_at, size),
+            )
+            self._evict_over_cap(conn, time.time())
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+
+    def _total_bytes(self, conn):
+        return conn.execute("SELECT bytes FROM store_size WHERE id = 0").fetchone()[0]
+
+    def _evict_over_cap(self, conn, now):
+        """Inside a write transaction: if over max_bytes, delete expired entries, then those closest to expiry."""
+        total = self._total_bytes(conn)
+        if total <= self.max_bytes:
+            return
+        conn.execute("DELETE FROM tool_results WHERE expires_at < ?", (now,))
+        total = self._total_bytes(conn)
+        excess = total - int(self.max_bytes * 0.9)  # evict down to 90% so the next write does not trigger again
+        if total > self.max_bytes and excess > 0:
+            freed = 0
+            victims = []
+            for namespace, key, size in conn.execute(
+                "SELECT namespace, key, size FROM tool_results ORDER BY expires_at"
+            ):
+                victims.append((namespace, key))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany("DELETE FROM tool_results WHERE namespace = ? AND key = ?", victims)
+
+    def evict(self, now=None):
+        """Delete expired entries, then those closest to expiry, until the store is under max_bytes."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._evict_over_cap(conn, now if now is not None else time.time())
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+
+    def stats(self):
+        try:
+            conn = self._connect()
+            entries = conn.execute("SELECT COUNT(*) FROM tool_results").fetchone()[0]
+            total = self._total_bytes(conn)
+        except sqlite3.Error as e:
+            return {"error": str(e), "max_bytes": self.max_bytes}
+        return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes}
+
+
+_stores = {}
+
+
+def shared_disk_store():
+    """The DiskStore configured by TOOL_CACHE_DB (one per path per process), or None if unset."""
+    path = os.getenv("TOOL_CACHE_DB")
+    if not path:
+        return None
+    if path not in _stores:
+        max_mb = float(os.getenv("TOOL_CACHE_DB_MAX_MB", "64"))
+        _stores[path] = DiskStore(path, max_bytes=int(max_mb * 1024 * 1024))
+    return _stores[path]
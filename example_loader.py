@@ -0,0 +1,36 @@
+"""
+Import the example scripts ("Ex 3 multiToolCall.py", ...) as modules.
+
+The file names contain spaces, so they cannot be imported with a plain
+`import`. Module-level settings (API keys, upstream URLs) are read at import
+time, so set the environment before calling load_example().
+
+Used by the worker pool (worker_pool.py) and the benchmarks.
+"""
+import glob
+import importlib.util
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_example(number):
+    """Import "Ex <number> *.py" once and return the module."""
+    name = f"ex{number}"
+    if name in sys.modules:
+        return sys.modules[name]
+
+    matches = glob.glob(os.path.join(REPO_ROOT, f"Ex {number} *.py"))
+    if not matches:
+        raise FileNotFoundError(f"No example script 'Ex {number} *.py' in {REPO_ROOT}")
+
+    spec = importlib.util.spec_from_file_location(name, matches[0])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
@@ -0,0 +1,368 @@
+"""
+Hedged requests: cut the latency tail of LLM and tool calls with a second attempt.
+
+A few slow responses from the OpenAI endpoint, OpenWeather or AirNow dominate
+p99, because each call waits alone for up to its full timeout. With hedging,
+a call that has not answered within its target's observed p95 gets a duplicate
+attempt; the first response wins and the other attempt is cancelled (asyncio)
+or abandoned (threads: its result is discarded when it arrives).
+
+- Hedge delay: per target ("openai", "openweather", "airnow"), the HEDGE_QUANTILE
+  (default 0.95) of a log-bucketed latency histogram of first attempts. No
+  call is hedged until a target has HEDGE_MIN_SAMPLES (default 20) samples.
+- Budget: every call earns HEDGE_BUDGET (default 0.05) of a hedge and a hedge
+  spends 1, so hedges never exceed 5% extra requests overall.
+- Errors are not hedged: a first attempt that fails before the delay raises as
+  before (retries stay with the SDK or llm_scheduler). If one attempt fails
+  after the hedge is sent, the other one is awaited. Only successful attempts
+  are timed: fast errors (429s, refused connections) would lower the delay and
+  hedge more exactly when the upstream is overloaded.
+- Rate limits: hedge_guard(), if given, is held around the duplicate attempt
+  only. The examples pass an llm_scheduler slot for "openai", so a hedge waits
+  for and spends RPM/TPM budget like any other call. A hedge that gets its
+  slot after the first attempt has already answered is not sent, and the
+  slot's grant is refunded (the value the guard yields, if it has refund()).
+- Threads: a call that could not be hedged (too few samples, or no budget
+  left) runs on the calling thread. Otherwise the first attempt runs on a pool
+  that grows with the number of concurrent calls, so calls never queue for a
+  thread and queueing never shows up as latency.
+- stats() / print_hedge_report(): calls, hedges, hedge wins, budget denials and
+  the latency saved, plus p50/p95/p99 as served and of the first attempts alone
+  (what the calls would have taken without hedging). A cancelled attempt's
+  latency is unknown; it is estimated as the median of the target's earlier
+  first attempts that were slower than the time it had already taken.
+
+Enable with HEDGE_REQUESTS=on; the report is printed when the agent exits.
+
+    response = hedger.call("openai", client.chat.completions.create, **request,
+                           hedge_guard=lambda: scheduler.slot(session, tokens))
+    resp = await hedger.acall("openweather", http_client.get, url, params=params)
+"""
+import asyncio
+import atexit
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "off").lower() in ("1", "on", "true", "yes")
+
+
+# --------- Latency histogram ---------
+class LatencyHistogram:
+    """Log-bucketed latencies (1 ms to 5 min, about 5% resolution); old samples fade by halving."""
+
+    MIN_S = 0.001
+    GROWTH = 1.05
+    BUCKETS = int(math.log(300 / MIN_S, GROWTH)) + 2
+
+    def __init__(self, max_count=10_000):
+        self.counts = [0] * self.BUCKETS
+        self.total = 0
+        self.max_count = max_count
+
+    def record(self, seconds):
+        index = 0 if seconds <= self.MIN_S else min(self.BUCKETS - 1, int(math.log(seconds / self.MIN_S, self.GROWTH)) + 1)
+        self.counts[index] += 1
+        self.total += 1
+        if self.total > self.max_count:  # keep following the target as its latency changes
+            self.counts = [c // 2 for c in self.counts]
+            self.total = sum(self.counts)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, in seconds (0 if empty)."""
+        if not self.total:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.MIN_S * self.GROWTH ** index
+        return self.MIN_S * self.GROWTH ** (self.BUCKETS - 1)
+
+    def median_above(self, seconds):
+        """Median of the samples slower than `seconds`, or `seconds` if there are none."""
+        first = 0 if seconds <= self.MIN_S else int(math.log(seconds / self.MIN_S, self.GROWTH)) + 2
+        tail = self.counts[first:]
+        rank = sum(tail) / 2
+        seen = 0
+        for offset, count in enumerate(tail):
+            seen += count
+            if count and seen >= rank:
+                return self.MIN_S * self.GROWTH ** (first + offset)
+        return seconds
+
+
+class _Superseded(Exception):
+    """A hedge that got its hedge_guard() only after the first attempt had answered; it is not sent."""
+
+
+def _hedge_attempt(fn, hedge_guard, settled, args, kwargs):
+    with hedge_guard() if hedge_guard is not None else nullcontext() as grant:
+        if settled.is_set():
+            if hasattr(grant, "refund"):  # e.g. an llm_scheduler slot: the budget was never used
+                grant.refund()
+            raise _Superseded()
+        return fn(*args, **kwargs)
+
+
+async def _ahedge_attempt(fn, hedge_guard, args, kwargs):
+    if hedge_guard is None:
+        return await fn(*args, **kwargs)
+    async with hedge_guard():  # cancelled, with its place in the queue, if the first attempt wins meanwhile
+        return await fn(*args, **kwargs)
+
+
+class _TargetStats:
+    __slots__ = ("first_attempts", "served", "calls", "hedges", "hedge_wins", "denied", "saved")
+
+    def __init__(self):
+        self.first_attempts = LatencyHistogram()  # drives the hedge delay; "without hedging"
+        self.served = LatencyHistogram()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.denied = 0
+        self.saved = 0.0
+
+
+# --------- Hedger ---------
+class Hedger:
+    """Issue a duplicate attempt for calls slower than their target's observed quantile, within a budget."""
+
+    enabled = True
+
+    def __init__(self, budget=0.05, quantile=0.95, min_samples=20, min_delay=0.005, max_credit=10.0, max_workers=4096):
+        self.budget = budget
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_credit = max_credit
+        self._credit = 0.0
+        self._targets = {}
+        self._lock = threading.Lock()
+        # Threads are started on demand and reused, so the pool holds about as many threads as there are
+        # concurrent calls plus hedges; max_workers is only a safety limit, far above that
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def _target(self, target):
+        stats = self._targets.get(target)
+        if stats is None:
+            stats = self._targets[target] = _TargetStats()
+        return stats
+
+    def hedge_delay(self, target):
+        """Seconds to wait before hedging a call to `target`, or None while too few samples are known."""
+        with self._lock:
+            stats = self._target(target)
+            if stats.first_attempts.total < self.min_samples:
+                return None
+            return max(self.min_delay, stats.first_attempts.quantile(self.quantile))
+
+    def _start_call(self, target):
+        with self._lock:
+            self._target(target).calls += 1
+            self._credit = min(self.max_credit, self._credit + self.budget)
+
+    def _has_credit(self):
+        with self._lock:
+            return self._credit >= 1
+
+    def _take_hedge(self, target):
+        with self._lock:
+            stats = self._target(target)
+            if self._credit < 1:
+                stats.denied += 1
+                return False
+            self._credit -= 1
+            stats.hedges += 1
+            return True
+
+    def _record(self, target, first_attempt=None, served=None, saved=None, hedge_won=False):
+        with self._lock:
+            stats = self._target(target)
+            if first_attempt is not None:
+                stats.first_attempts.record(first_attempt)
+            if served is not None:
+                stats.served.record(served)
+            if saved:
+                stats.saved += saved
+            if hedge_won:
+                stats.hedge_wins += 1
+
+    # ----- threads -----
+    def call(self, target, fn, *args, hedge_guard=None, **kwargs):
+        """
+        Run fn(*args, **kwargs), hedged with a second attempt if it is slower than the target's quantile.
+        hedge_guard() returns a context manager held around the second attempt only.
+        """
+        self._start_call(target)
+        delay = self.hedge_delay(target)
+        start = time.perf_counter()
+        if delay is None or not self._has_credit():  # still learning, or a hedge could not be paid for
+            result = fn(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            self._record(target, first_attempt=elapsed, served=elapsed)
+            if delay is not None and elapsed > delay:
+                with self._lock:
+                    self._target(target).denied += 1
+            return result
+
+        primary = self._executor.submit(fn, *args, **kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_hedge(target):
+            result = primary.result()
+            elapsed = time.perf_counter() - start
+            self._record(target, first_attempt=elapsed, served=elapsed)
+            return result
+
+        settled = threading.Event()
+        hedge = self._executor.submit(_hedge_attempt, fn, hedge_guard, settled, args, kwargs)
+        pending = {primary, hedge}
+        winner = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((f for f in done if f.exception() is None), None)
+            if winner is not None:
+                break
+        settled.set()  # a hedge still waiting for its guard is dropped
+        served = time.perf_counter() - start
+        if winner is None:  # both attempts failed
+            return primary.result()
+
+        if winner is primary:
+            self._record(target, first_attempt=served, served=served)
+        else:
+            self._record(target, served=served, hedge_won=True)
+
+            def primary_finished(future):
+                # The abandoned first attempt reports its real latency once it is done, if it succeeded
+                if future.exception() is None:
+                    elapsed = time.perf_counter() - start
+                    self._record(target, first_attempt=elapsed, saved=elapsed - served)
+
+            primary.add_done_callback(primary_finished)
+        return winner.result()
+
+    # ----- asyncio -----
+    async def acall(self, target, fn, *args, hedge_guard=None, **kwargs):
+        """call() for coroutine functions (hedge_guard() returns an async context manager); the loser is cancelled."""
+        self._start_call(target)
+        delay = self.hedge_delay(target)
+        start = time.perf_counter()
+        if delay is None:
+            result = await fn(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            self._record(target, first_attempt=elapsed, served=elapsed)
+            return result
+
+        primary = asyncio.ensure_future(fn(*args, **kwargs))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except BaseException:
+            primary.cancel()
+            raise
+        if done or not self._take_hedge(target):
+            result = await primary
+            elapsed = time.perf_counter() - start
+            self._record(target, first_attempt=elapsed, served=elapsed)
+            return result
+
+        hedge = asyncio.ensure_future(_ahedge_attempt(fn, hedge_guard, args, kwargs))
+        pending = {primary, hedge}
+        winner = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in done if not t.cancelled() and t.exception() is None), None)
+                if winner is not None:
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+        if winner is None:  # both attempts failed
+            return await primary
+        served = time.perf_counter() - start
+        if winner is primary:
+            self._record(target, first_attempt=served, served=served)
+            return winner.result()
+        # The first attempt was cancelled; estimate what it would have taken from the target's tail
+        with self._lock:
+            estimate = self._target(target).first_attempts.median_above(served)
+        self._record(target, first_attempt=estimate, served=served, saved=estimate - served, hedge_won=True)
+        return winner.result()
+
+    # ----- report -----
+    def stats(self):
+        """{target: {calls, hedges, hedge_wins, budget_denied, saved_ms, delay_ms, served_*, first_attempt_*}}."""
+        with self._lock:
+            result = {}
+            for target, s in sorted(self._targets.items()):
+                row = {
+                    "calls": s.calls,
+                    "hedges": s.hedges,
+                    "hedge_rate": s.hedges / s.calls if s.calls else 0.0,
+                    "hedge_wins": s.hedge_wins,
+                    "budget_denied": s.denied,
+                    "saved_ms": s.saved * 1000,
+                    "delay_ms": (max(self.min_delay, s.first_attempts.quantile(self.quantile)) * 1000
+                                 if s.first_attempts.total >= self.min_samples else None),
+                }
+                for name, histogram in (("served", s.served), ("first_attempt", s.first_attempts)):
+                    for q in (50, 95, 99):
+                        row[f"{name}_p{q}_ms"] = histogram.quantile(q / 100) * 1000
+                result[target] = row
+            return result
+
+
+class NullHedger:
+    """Stand-in used when hedging is off; calls run once, as before."""
+
+    enabled = False
+
+    def call(self, target, fn, *args, hedge_guard=None, **kwargs):
+        return fn(*args, **kwargs)
+
+    async def acall(self, target, fn, *args, hedge_guard=None, **kwargs):
+        return await fn(*args, **kwargs)
+
+    def stats(self):
+        return {}
+
+
+def print_hedge_report(stats):
+    """Print stats() as a table: hedges sent and won, and p95/p99 with vs without hedging."""
+    if not stats:
+        return
+    print("\nHedged requests (latencies in ms; 'alone' = first attempts only, i.e. without hedging)")
+    print(f"{'target':<12} {'calls':>6} {'hedges':>7} {'wins':>5} {'denied':>6} {'delay':>7} "
+          f"{'p95':>7} {'alone':>7} {'p99':>7} {'alone':>7} {'saved':>9}")
+    print("-" * 90)
+    for target, s in stats.items():
+        delay = f"{s['delay_ms']:.0f}" if s["delay_ms"] is not None else "-"
+        print(f"{target:<12} {s['calls']:>6} {s['hedges']:>7} {s['hedge_wins']:>5} {s['budget_denied']:>6} {delay:>7} "
+              f"{s['served_p95_ms']:>7.0f} {s['first_attempt_p95_ms']:>7.0f} "
+              f"{s['served_p99_ms']:>7.0f} {s['first_attempt_p99_ms']:>7.0f} {s['saved_ms']:>9.0f}")
+    print("(saved = total latency the winning hedges saved; estimated where the slow attempt was cancelled)")
+
+
+_shared = None
+
+
+def shared_hedger():
+    """The process-wide hedger configured by HEDGE_REQUESTS / HEDGE_BUDGET / HEDGE_QUANTILE / HEDGE_MIN_SAMPLES."""
+    global _shared
+    if _shared is None:
+        if HEDGE_REQUESTS:
+            _shared = Hedger(
+                budget=float(os.getenv("HEDGE_BUDGET", "0.05")),
+                quantile=float(os.getenv("HEDGE_QUANTILE", "0.95")),
+                min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", "20")),
+            )
+            atexit.register(lambda: print_hedge_report(_shared.stats()))
+        else:
+            _shared = NullHedger()
+    return _shared
@@ -0,0 +1,395 @@
+"""
+Client-side RPM/TPM scheduler for outbound chat completion calls.
+
+Under concurrency, bursts of calls from many sessions exceed the provider's
+requests-per-minute and tokens-per-minute limits and come back as 429s.
+LLMScheduler makes each call wait for a slot instead:
+
+- Budgets: two token buckets, refilled continuously, one for requests (RPM)
+  and one for tokens (TPM). A call's tokens are estimated before sending
+  (prompt characters / 4 plus max_tokens, as the provider counts them); a
+  call whose reported usage exceeds the estimate is charged the difference.
+- Priority: follow-up calls (the model answering with tool results, which
+  completes a turn) go before the first call of a new turn.
+- Fairness: within a priority, sessions share the budget by weighted fair
+  queuing on estimated tokens, so a session with long prompts or many calls
+  cannot starve the others.
+- 429s that still happen pause every call for the Retry-After time.
+- Retries: with a scheduler the SDK's own retries are turned off
+  (max_retries=0), because they would spend RPM unseen. Errors the SDK would
+  retry (connection errors, 408/409/429, 5xx) are retried up to MAX_RETRIES
+  times through a new slot instead.
+- stats(): queue depth (current and max), wait-time percentiles per priority,
+  dispatched calls and 429s.
+
+Works from threads (slot(): Ex 3/4, through scheduled_completion()) and from
+asyncio (aslot(): Ex 5).
+
+Enable with LLM_RPM_LIMIT and/or LLM_TPM_LIMIT (set them a little below the
+account's limits); with neither set shared_llm_scheduler() returns a no-op.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from openai import APIConnectionError
+
+FOLLOWUP, NEW_TURN = 0, 1
+PRIORITY_NAMES = {FOLLOWUP: "followup", NEW_TURN: "new_turn"}
+DEFAULT_MAX_TOKENS = 500  # what Ex 3/4 request; assumed when a call does not set max_tokens
+MAX_RETRIES = 2  # the OpenAI SDK's default, retried through the scheduler instead of inside the SDK
+
+
+# --------- Token estimate ---------
+def _message_text(message):
+    if isinstance(message, dict):
+        return json.dumps(message, default=str)
+    # LangChain message
+    return f"{message.type} {message.content} {getattr(message, 'tool_calls', '') or ''}"
+
+
+def estimate_tokens(messages, tools=None, max_tokens=None):
+    """Tokens a call counts against TPM: the prompt (about 4 characters per token) plus max_tokens."""
+    if max_tokens is None:
+        max_tokens = DEFAULT_MAX_TOKENS
+    chars = sum(len(_message_text(m)) for m in messages)
+    if tools:
+        chars += len(json.dumps(tools, default=str))
+    return chars // 4 + 1 + max_tokens
+
+
+def estimate_request_tokens(request):
+    """estimate_tokens() for a chat.completions.create() keyword dict."""
+    return estimate_tokens(request.get("messages", ()), request.get("tools"), request.get("max_tokens"))
+
+
+# --------- Budgets ---------
+class _Bucket:
+    """Token bucket holding up to one minute's budget."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount):
+        """Seconds until `amount` is available (0 if it is now)."""
+        amount = min(amount, self.capacity)  # a call larger than the budget waits for a full bucket
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+
+class _Unlimited:
+    capacity = level = float("inf")
+
+    def refill(self, now):
+        pass
+
+    def wait_for(self, amount):
+        return 0.0
+
+
+# --------- Scheduler ---------
+class _Waiter:
+    __slots__ = ("session", "tokens", "priority", "enqueued", "granted", "cancelled", "event", "future", "loop")
+
+    def __init__(self, session, tokens, priority):
+        self.session = session
+        self.tokens = tokens
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+        self.event = None
+        self.future = None
+        self.loop = None
+
+    def grant(self):
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        elif self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Call:
+    """Handle yielded by slot()/aslot(); report the actual usage so underestimates are charged."""
+
+    def __init__(self, scheduler, estimate, priority):
+        self._scheduler = scheduler
+        self._priority = priority
+        self.estimate = estimate
+
+    def record_usage(self, total_tokens):
+        if total_tokens:
+            self._scheduler._correct(self.estimate, total_tokens)
+
+    def refund(self):
+        """Give the budget back for a granted call that is not sent after all (a superseded hedge)."""
+        self._scheduler._refund(self.estimate, self._priority)
+
+
+class LLMScheduler:
+    """Rate-limit-aware, priority and weighted-fair queue in front of the chat completions API."""
+
+    enabled = True
+
+    def __init__(self, rpm=None, tpm=None, weights=None, history=10_000):
+        self.requests = _Bucket(rpm) if rpm else _Unlimited()
+        self.tokens = _Bucket(tpm) if tpm else _Unlimited()
+        self.weights = weights or {}  # session -> weight (default 1)
+
+        self._lock = threading.Lock()
+        self._heap = []
+        self._seq = itertools.count()
+        self._vtime = 0.0
+        self._finish = {}  # session -> virtual finish time of its last queued call
+        self._paused_until = 0.0
+
+        self.max_depth = 0
+        self.rate_limited = 0
+        self._waits = {p: deque(maxlen=history) for p in PRIORITY_NAMES}
+        self._dispatched = {p: 0 for p in PRIORITY_NAMES}
+
+    # ----- queueing -----
+    def _enqueue(self, waiter):
+        """Queue a waiter with its weighted-fair tag (caller holds the lock)."""
+        weight = self.weights.get(waiter.session, 1.0)
+        tag = max(self._vtime, self._finish.get(waiter.session, 0.0)) + waiter.tokens / weight
+        self._finish[waiter.session] = tag
+        heapq.heappush(self._heap, (waiter.priority, tag, next(self._seq), waiter))
+        self.max_depth = max(self.max_depth, len(self._heap))
+
+    def _pump(self):
+        """Grant the head of the queue while the budgets allow; return seconds until the next grant could happen."""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            while self._heap:
+                _, tag, _, waiter = self._heap[0]
+                if waiter.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+                wait = max(self._paused_until - now, self.requests.wait_for(1), self.tokens.wait_for(waiter.tokens))
+                if wait > 0:
+                    return wait
+                heapq.heappop(self._heap)
+                self.requests.level -= 1
+                self.tokens.level -= waiter.tokens
+                self._vtime = max(self._vtime, tag)
+                if self._finish.get(waiter.session, 0.0) <= self._vtime:
+                    self._finish.pop(waiter.session, None)
+                self._waits[waiter.priority].append(now - waiter.enqueued)
+                self._dispatched[waiter.priority] += 1
+                waiter.grant()
+            return None
+
+    def _correct(self, estimate, actual):
+        # Unused max_tokens are not refunded: the provider charges them when the call is admitted
+        if actual > estimate:
+            with self._lock:
+                self.tokens.level -= actual - estimate
+
+    def _refund(self, tokens, priority):
+        with self._lock:
+            self.requests.level = min(self.requests.capacity, self.requests.level + 1)
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + tokens)
+            self._dispatched[priority] -= 1
+
+    def _note_error(self, exc):
+        """Pause all calls after a 429, for its Retry-After time (default 1 s)."""
+        if getattr(exc, "status_code", None) != 429:
+            return
+        retry_after = 1.0
+        response = getattr(exc, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after", retry_after))
+            except (TypeError, ValueError):
+                pass
+        with self._lock:
+            self.rate_limited += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    # ----- sync -----
+    @contextmanager
+    def slot(self, session, tokens, followup=False):
+        """Wait for budget for one call of `session` estimated at `tokens`; yields a _Call."""
+        waiter = _Waiter(session, tokens, FOLLOWUP if followup else NEW_TURN)
+        waiter.event = threading.Event()
+        with self._lock:
+            self._enqueue(waiter)
+        while not waiter.granted:
+            wait = self._pump()
+            if not waiter.granted:
+                waiter.event.wait(wait)
+        try:
+            yield _Call(self, tokens, waiter.priority)
+        except Exception as e:
+            self._note_error(e)
+            raise
+        finally:
+            self._pump()  # hand the budget on without waiting for the next timeout
+
+    # ----- async -----
+    @asynccontextmanager
+    async def aslot(self, session, tokens, followup=False):
+        """slot() for coroutines: waits without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(session, tokens, FOLLOWUP if followup else NEW_TURN)
+        waiter.loop, waiter.future = loop, loop.create_future()
+        with self._lock:
+            self._enqueue(waiter)
+        try:
+            while not waiter.granted:
+                wait = self._pump()
+                if not waiter.granted:
+                    try:
+                        await asyncio.wait_for(asyncio.shield(waiter.future), wait)
+                    except asyncio.TimeoutError:
+                        pass
+        except BaseException:
+            waiter.cancelled = True
+            raise
+        try:
+            yield _Call(self, tokens, waiter.priority)
+        except Exception as e:
+            self._note_error(e)
+            raise
+        finally:
+            self._pump()
+
+    # ----- metrics -----
+    def stats(self):
+        with self._lock:
+            waits = {PRIORITY_NAMES[p]: sorted(samples) for p, samples in self._waits.items()}
+            stats = {
+                "queue_depth": sum(1 for *_, w in self._heap if not w.cancelled),
+                "max_queue_depth": self.max_depth,
+                "rate_limited_429": self.rate_limited,
+            }
+            dispatched = dict(self._dispatched)
+        for priority, name in PRIORITY_NAMES.items():
+            samples = waits[name]
+            stats[name] = {
+                "calls": dispatched[priority],
+                "wait_mean_ms": 1000 * sum(samples) / len(samples) if samples else 0.0,
+                "wait_p50_ms": 1000 * samples[len(samples) // 2] if samples else 0.0,
+                "wait_p95_ms": 1000 * samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0.0,
+                "wait_max_ms": 1000 * samples[-1] if samples else 0.0,
+            }
+        return stats
+
+
+# --------- Retries ---------
+def should_retry(exc):
+    """The errors the OpenAI SDK retries: connection errors and timeouts, 408, 409, 429 and 5xx."""
+    if isinstance(exc, APIConnectionError):
+        return True
+    status = getattr(exc, "status_code", None)
+    return status in (408, 409, 429) or (status is not None and status >= 500)
+
+
+def retry_delay(exc, attempt):
+    """Seconds to back off before retry `attempt` (1, 2, ...); a 429 waits in the scheduler's pause instead."""
+    if getattr(exc, "status_code", None) == 429:
+        return 0.0
+    return min(8.0, 0.5 * 2 ** (attempt - 1)) * random.uniform(0.75, 1.0)
+
+
+# --------- Chat completions ---------
+def _recording_usage(stream, call):
+    """Pass a streamed response through, recording the usage reported in its last chunk."""
+    for chunk in stream:
+        if getattr(chunk, "usage", None):
+            call.record_usage(chunk.usage.total_tokens)
+        yield chunk
+
+
+def scheduled_completion(client, scheduler, hedger, session, request, followup=False, consume_stream=None):
+    """
+    Send one chat.completions.create(**request) for `session` through `scheduler`, hedged by `hedger`.
+
+    With consume_stream the response is streamed, with usage in its last chunk, and
+    consume_stream(chunks) runs inside the slot; its result is returned. Streams are not hedged.
+    With a scheduler, failed requests are retried through it (see MAX_RETRIES), not by the SDK:
+    create `client` with max_retries=0 then.
+    """
+    attempts = 1 + MAX_RETRIES if scheduler.enabled else 1
+    tokens = estimate_request_tokens(request)
+    for attempt in range(attempts):
+        sent = False  # errors after the response started (e.g. from consume_stream) are not retried
+        try:
+            with scheduler.slot(session, tokens, followup=followup) as call:
+                if consume_stream is not None:
+                    stream = client.chat.completions.create(**request, stream=True, stream_options={"include_usage": True})
+                    sent = True
+                    return consume_stream(_recording_usage(stream, call))
+                # A hedged duplicate waits for and spends its own budget, like any other call
+                response = hedger.call("openai", client.chat.completions.create, **request,
+                                       hedge_guard=lambda: scheduler.slot(session, tokens, followup=followup))
+                if response.usage:
+                    call.record_usage(response.usage.total_tokens)
+                return response
+        except Exception as e:
+            if sent or attempt + 1 == attempts or not should_retry(e):
+                raise
+            time.sleep(retry_delay(e, attempt + 1))
+
+
+class NullScheduler:
+    """Stand-in used when no limits are configured; calls go out immediately."""
+
+    enabled = False
+
+    @contextmanager
+    def slot(self, session, tokens, followup=False):
+        yield _NULL_CALL
+
+    @asynccontextmanager
+    async def aslot(self, session, tokens, followup=False):
+        yield _NULL_CALL
+
+    def stats(self):
+        return {}
+
+
+class _NullCall:
+    estimate = 0
+
+    def record_usage(self, total_tokens):
+        pass
+
+    def refund(self):
+        pass
+
+
+_NULL_CALL = _NullCall()
+_shared = None
+
+
+def shared_llm_scheduler():
+    """The process-wide scheduler configured by LLM_RPM_LIMIT / LLM_TPM_LIMIT (a NullScheduler if neither is set)."""
+    global _shared
+    if _shared is None:
+        rpm = float(os.getenv("LLM_RPM_LIMIT", "0") or 0)
+        tpm = float(os.getenv("LLM_TPM_LIMIT", "0") or 0)
+        _shared = LLMScheduler(rpm=rpm, tpm=tpm) if rpm or tpm else NullScheduler()
+    return _shared
@@ -0,0 +1,197 @@
+"""
+Start tool calls while the model is still streaming its response.
+
+With a non-streaming tool-decision call nothing can happen until the whole
+response, including every tool call's argument JSON, has been generated.
+With `stream=True` the tool calls arrive as `delta.tool_calls` fragments;
+run_streamed_tool_calls() reassembles them and submits each call to a thread
+pool as soon as its arguments are complete, so the first weather fetch
+overlaps the generation of the remaining calls.
+
+A call's arguments count as complete when
+  - the buffered text parses as a JSON object (checked only when it ends in "}"),
+  - the model starts the next tool call (calls are streamed one after another), or
+  - the stream ends.
+
+Arguments that are cut off or malformed are repaired only where no value
+changes (missing closing braces, a trailing comma). A value that was cut off
+(e.g. "zip_code": "100, "temp": 2 or "days": ["mon") is never guessed: the tool
+is not run and its result is an error message the model can react to. If
+the text keeps growing after a call was dispatched early and the final
+arguments differ, the call is run again with the final arguments.
+
+Enable in Ex 3/4 with STREAM_TOOL_CALLS=on (default off). Both examples make
+their tool-decision call through run_tool_decision(), which also runs the
+requested tools when the response is not streamed.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+STREAM_TOOL_CALLS = os.getenv("STREAM_TOOL_CALLS", "off").lower() in ("1", "on", "true", "yes")
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def repair_arguments(text):
+    """Close the braces of cut-off JSON and drop a trailing comma; None if a value itself was cut off."""
+    stack = []
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+        elif ch in "}]" and stack and stack[-1] == ch:
+            stack.pop()
+
+    repaired = text.rstrip()
+    if in_string or not repaired.endswith(("}", "]", '"', ",")):
+        return None  # cut off inside a key, string, number or literal
+    if "]" in stack:
+        return None  # closing a cut-off array would turn a partial list into a complete one
+    if repaired.endswith(","):
+        repaired = repaired[:-1]
+    return repaired + "".join(reversed(stack))
+
+
+def parse_arguments(text):
+    """Return (arguments dict, None) or (None, error message) for a tool call's argument text."""
+    if not text.strip():
+        return {}, None
+    for candidate in (text, repair_arguments(text)):
+        if candidate is None:
+            continue
+        try:
+            args = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(args, dict):
+            return args, None
+        return None, "arguments are not a JSON object"
+    return None, "arguments are not valid JSON"
+
+
+class _StreamedCall:
+    __slots__ = ("index", "id", "name", "arguments", "dispatched_args", "future")
+
+    def __init__(self, index):
+        self.index = index
+        self.id = None
+        self.name = ""
+        self.arguments = ""
+        self.dispatched_args = None
+        self.future = None
+
+
+def _invoke(call_tool, name, args, error):
+    if error:
+        return f"Invalid arguments for {name}: {error}."
+    try:
+        return call_tool(name, args)
+    except Exception as e:  # reported to the model like an upstream failure
+        return f"Error running {name}: {e}"
+
+
+def run_streamed_tool_calls(stream, call_tool, executor=None, max_workers=4):
+    """
+    Consume a streamed chat completion, running each tool call as soon as its arguments are complete.
+
+    `call_tool(name, args)` runs one tool and returns its result text. Returns
+    (content, tool_calls, results): the assistant's text, the tool calls as
+    assistant-message dicts, and the tool results in the same order.
+    """
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="streamed-tool")
+    calls = {}
+    content = []
+
+    def dispatch(call):
+        args, error = parse_arguments(call.arguments)
+        call.dispatched_args = (args, error)
+        call.future = executor.submit(_invoke, call_tool, call.name, args, error)
+
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta is None:
+                continue
+            if delta.content:
+                content.append(delta.content)
+            for fragment in delta.tool_calls or ():
+                call = calls.get(fragment.index)
+                if call is None:
+                    call = calls[fragment.index] = _StreamedCall(fragment.index)
+                    # The model has moved on: every earlier call is complete
+                    for earlier in calls.values():
+                        if earlier.index < fragment.index and earlier.future is None:
+                            dispatch(earlier)
+                if fragment.id:
+                    call.id = fragment.id
+                if fragment.function is not None:
+                    call.name += fragment.function.name or ""
+                    call.arguments += fragment.function.arguments or ""
+                if call.future is None and call.name and call.arguments.rstrip().endswith("}"):
+                    try:
+                        complete = isinstance(json.loads(call.arguments), dict)
+                    except json.JSONDecodeError:
+                        complete = False
+                    if complete:
+                        dispatch(call)
+
+        ordered = [calls[index] for index in sorted(calls)]
+        for call in ordered:
+            if call.future is None:
+                dispatch(call)
+            elif parse_arguments(call.arguments) != call.dispatched_args:
+                dispatch(call)  # the arguments changed after the early start; use the final ones
+        results = [call.future.result() for call in ordered]
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+
+    tool_calls = []
+    for call in ordered:
+        args, error = call.dispatched_args
+        tool_calls.append({
+            "id": call.id,
+            "type": "function",
+            "function": {
+                "name": call.name,
+                # repaired arguments are stored as valid JSON so the next request is accepted
+                "arguments": call.arguments if error or args is None else json.dumps(args),
+            },
+        })
+    return "".join(content) or None, tool_calls, results
+
+
+# --------- Tool-decision call ---------
+def run_tool_decision(send, request, call_tool):
+    """
+    First call of a turn: the model decides whether to use tool(s), and the tools it asks for run.
+
+    `send(request, consume_stream=None)` sends one chat completion (see
+    llm_scheduler.scheduled_completion()). With STREAM_TOOL_CALLS each tool starts
+    as soon as its arguments are complete; otherwise the tools run one by one after
+    the response. Returns (content, tool_calls, results) like run_streamed_tool_calls().
+    """
+    if STREAM_TOOL_CALLS:
+        return send(request, consume_stream=lambda stream: run_streamed_tool_calls(stream, call_tool))
+
+    choice = send(request).choices[0].message
+    tool_calls = [tool_call.model_dump() for tool_call in choice.tool_calls or ()]
+    results = [
+        _invoke(call_tool, tool_call["function"]["name"], *parse_arguments(tool_call["function"]["arguments"] or ""))
+        for tool_call in tool_calls
+    ]
+    return choice.content, tool_calls, results
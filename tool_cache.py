@@ -0,0 +1,383 @@
+"""
+Tool-result cache with stale-while-revalidate and background refresh of hot keys.
+
+Weather and air quality only change on the upstream's own schedule, so the
+same location asked about twice in a few minutes does not need two API calls.
+ToolCache keeps formatted tool results per key ((city, country, units) or
+ZIP code):
+
+- fresh hit:  returned immediately
+- near expiry (or just expired, within the stale grace period):
+              the cached value is returned immediately and a refresh is
+              started in the background
+- miss:       fetched inline (only this path costs the user an upstream call)
+
+A background refresher tracks which keys are hot (hit repeatedly within the
+last `hot_window` seconds) and refreshes them just before they go stale, so
+popular locations are always served from cache. Refreshes, both background
+and stale-while-revalidate, are limited by a per-hour upstream request
+budget; user-facing misses are never blocked by it.
+
+Expiry follows the upstream cadence:
+- OpenWeather updates roughly every 10 minutes -> fixed 10 minute TTL
+- AirNow publishes one observation per hour (HourObserved), usually about
+  25 minutes after the hour -> entries expire at the next publish time
+
+Works from both sync code (get(), start_refresher(): worker threads) and async
+code (aget(), start_async_refresher(): tasks on the running event loop).
+
+With TOOL_CACHE_DB set, results are also written through to a SQLite store
+shared by all agent processes on the machine (see disk_cache.py); a miss in
+memory checks it before calling the upstream.
+
+Set TOOL_CACHE=off to bypass caching entirely.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from disk_cache import shared_disk_store
+from tool_results import TOOL_RESULT_FORMAT
+
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE", "on").lower() not in ("0", "off", "false", "no")
+
+
+class UpstreamError(Exception):
+    """A tool's upstream call failed; the message is returned to the model and nothing is cached."""
+
+
+# --------- Expiry policy ---------
+class CachePolicy:
+    """When an entry fetched at a given time expires, and how early/late it may be refreshed."""
+
+    def __init__(self, ttl=None, period=None, offset=0, refresh_ahead=0, stale_grace=0):
+        self.ttl = ttl
+        self.period = period
+        self.offset = offset
+        self.refresh_ahead = refresh_ahead
+        self.stale_grace = stale_grace
+
+    def expires_at(self, fetched_at):
+        if self.period:
+            # Next publish time (offset seconds past a period boundary) after fetched_at
+            cycles = math.floor((fetched_at - self.offset) / self.period) + 1
+            return cycles * self.period + self.offset
+        return fetched_at + self.ttl
+
+
+OPENWEATHER_POLICY = CachePolicy(ttl=600, refresh_ahead=60, stale_grace=120)
+AIRNOW_POLICY = CachePolicy(
+    period=3600,
+    offset=int(os.getenv("AIRNOW_PUBLISH_LAG_SECONDS", "1500")),
+    refresh_ahead=0,  # refreshing before the new hour is published would fetch the same observation
+    stale_grace=600,
+)
+
+
+# --------- Refresh budget ---------
+class RequestBudget:
+    """Token bucket limiting refresh requests to `per_hour` (bursts up to 5 minutes' worth)."""
+
+    def __init__(self, per_hour):
+        self.rate = per_hour / 3600
+        self.capacity = max(1.0, per_hour / 12)
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def try_take(self):
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+# --------- Cache ---------
+class _Entry:
+    __slots__ = ("value", "fetched_at", "expires_at", "fetch", "is_async", "hits")
+
+    def __init__(self, value, fetched_at, expires_at, fetch, is_async):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.expires_at = expires_at
+        self.fetch = fetch
+        self.is_async = is_async
+        self.hits = deque()  # hit timestamps within the hot window
+
+
+class ToolCache:
+    """TTL cache for one tool with stale-while-revalidate and hot-key background refresh."""
+
+    def __init__(self, name, policy, refresh_budget_per_hour=600, hot_window=1800, hot_min_hits=2,
+                 max_entries=1024, refresh_workers=4, tick=5.0, store=None, namespace=None):
+        self.name = name
+        self.policy = policy
+        self.store = store
+        self.namespace = namespace or name
+        self.budget = RequestBudget(refresh_budget_per_hour)
+        self.hot_window = hot_window
+        self.hot_min_hits = hot_min_hits
+        self.max_entries = max_entries
+        self.refresh_workers = refresh_workers
+        self.tick = tick
+
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._tasks = set()
+        self._refresher = None
+        self.counters = {"fresh": 0, "stale": 0, "disk": 0, "miss": 0,
+                         "refreshed": 0, "refresh_failed": 0, "over_budget": 0}
+
+    # ----- lookups -----
+    def _lookup(self, key, now):
+        """Return (value, state) with state in fresh/stale/miss, recording the hit."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now >= entry.expires_at + self.policy.stale_grace:
+                return None, "miss"
+            entry.hits.append(now)
+            while entry.hits and entry.hits[0] < now - self.hot_window:
+                entry.hits.popleft()
+            state = "fresh" if now < entry.expires_at - self.policy.refresh_ahead else "stale"
+            self.counters[state] += 1
+            return entry.value, state
+
+    def _store(self, key, value, fetch, is_async, fetched_at, hit=False):
+        with self._lock:
+            entry = self._entries.get(key)
+            expires_at = self.policy.expires_at(fetched_at)
+            if entry is None:
+                entry = _Entry(value, fetched_at, expires_at, fetch, is_async)
+                self._entries[key] = entry
+                if len(self._entries) > self.max_entries:
+                    self._evict_coldest()
+            else:
+                entry.value, entry.fetched_at, entry.expires_at = value, fetched_at, expires_at
+            if hit:
+                entry.hits.append(fetched_at)
+
+    # ----- shared disk tier -----
+    def _from_store(self, key, fetch, is_async, now):
+        """On a memory miss, adopt a result another process stored; return (value, state)."""
+        row = self.store.get(self.namespace, key, now, grace=self.policy.stale_grace) if self.store else None
+        if row is None:
+            with self._lock:
+                self.counters["miss"] += 1
+            return None, "miss"
+        value, fetched_at, expires_at = row
+        self._store(key, value, fetch, is_async, fetched_at, hit=True)
+        with self._lock:
+            self.counters["disk"] += 1
+        return value, ("fresh" if now < expires_at - self.policy.refresh_ahead else "stale")
+
+    def _fresher_in_store(self, key, entry):
+        """A result another process fetched after `entry`, if the disk tier has one."""
+        if self.store is None:
+            return None
+        row = self.store.get(self.namespace, key)
+        if row is None or row[1] <= entry.fetched_at:
+            return None
+        return row
+
+    def _save(self, key, value, fetched_at):
+        if self.store is not None:
+            self.store.put(self.namespace, key, value, fetched_at, self.policy.expires_at(fetched_at))
+
+    def _evict_coldest(self):
+        coldest = min(self._entries, key=lambda k: self._entries[k].hits[-1] if self._entries[k].hits else 0)
+        del self._entries[coldest]
+
+    def _claim_refresh(self, key):
+        """Mark `key` as refreshing if it is not already and the budget allows; return True if claimed."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            if not self.budget.try_take():
+                self.counters["over_budget"] += 1
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _refresh_done(self, key, value=None, failed=False, fetched_at=None, save=True):
+        if not failed:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:  # may have been evicted meanwhile
+                self._store(key, value, entry.fetch, entry.is_async, fetched_at)
+            if save:
+                self._save(key, value, fetched_at)
+        with self._lock:
+            self._refreshing.discard(key)
+            self.counters["refresh_failed" if failed else "refreshed"] += 1
+
+    # ----- sync API -----
+    def get(self, key, fetch):
+        """Return the cached result for `key`, calling `fetch()` on a miss. UpstreamError propagates."""
+        if not TOOL_CACHE_ENABLED:
+            return fetch()
+        now = time.time()
+        value, state = self._lookup(key, now)
+        if state == "miss":
+            value, state = self._from_store(key, fetch, False, now)
+        if state == "stale":
+            self._refresh_in_thread(key)
+        if state != "miss":
+            return value
+        value = fetch()
+        self._store(key, value, fetch, False, now, hit=True)
+        self._save(key, value, now)
+        return value
+
+    def _refresh_in_thread(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        # Async fetches are bound to their event loop; those are refreshed by _refresh_in_task()
+        if entry is None or entry.is_async or not self._claim_refresh(key):
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.refresh_workers, thread_name_prefix=f"{self.name}-refresh")
+
+        def refresh():
+            fresher = self._fresher_in_store(key, entry)
+            if fresher is not None:  # another process already refreshed it
+                self._refresh_done(key, fresher[0], fetched_at=fresher[1], save=False)
+                return
+            fetched_at = time.time()
+            try:
+                value = entry.fetch()
+            except Exception:
+                self._refresh_done(key, failed=True)
+            else:
+                self._refresh_done(key, value, fetched_at=fetched_at)
+
+        self._executor.submit(refresh)
+
+    # ----- async API -----
+    async def aget(self, key, fetch):
+        """Async get(): `fetch` is a coroutine function; refreshes run as tasks on the current loop."""
+        if not TOOL_CACHE_ENABLED:
+            return await fetch()
+        now = time.time()
+        value, state = self._lookup(key, now)
+        if state == "miss":
+            value, state = self._from_store(key, fetch, True, now)
+        if state == "stale":
+            self._refresh_in_task(key)
+        if state != "miss":
+            return value
+        value = await fetch()
+        self._store(key, value, fetch, True, now, hit=True)
+        self._save(key, value, now)
+        return value
+
+    def _refresh_in_task(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or not entry.is_async or not self._claim_refresh(key):
+            return
+
+        async def refresh():
+            fresher = self._fresher_in_store(key, entry)
+            if fresher is not None:  # another process already refreshed it
+                self._refresh_done(key, fresher[0], fetched_at=fresher[1], save=False)
+                return
+            fetched_at = time.time()
+            try:
+                value = await entry.fetch()
+            except Exception:
+                self._refresh_done(key, failed=True)
+            else:
+                self._refresh_done(key, value, fetched_at=fetched_at)
+
+        task = asyncio.get_running_loop().create_task(refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # ----- background refresher -----
+    def due_hot_keys(self, now=None):
+        """Hot keys whose entries are inside their refresh window, hottest first."""
+        now = now if now is not None else time.time()
+        with self._lock:
+            due = []
+            for key, entry in self._entries.items():
+                recent = sum(1 for t in entry.hits if t >= now - self.hot_window)
+                if recent >= self.hot_min_hits and now >= entry.expires_at - self.policy.refresh_ahead \
+                        and key not in self._refreshing:
+                    due.append((recent, key))
+        return [key for _, key in sorted(due, key=lambda item: item[0], reverse=True)]
+
+    def start_refresher(self):
+        """Refresh hot keys from a daemon thread (for the sync agents)."""
+        if self._refresher is not None or not TOOL_CACHE_ENABLED:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.tick)
+                for key in self.due_hot_keys():
+                    self._refresh_in_thread(key)
+
+        self._refresher = threading.Thread(target=loop, name=f"{self.name}-refresher", daemon=True)
+        self._refresher.start()
+
+    def start_async_refresher(self):
+        """Refresh hot keys from a task on the running event loop (for async agents); returns the task."""
+        if self._refresher is not None or not TOOL_CACHE_ENABLED:
+            return self._refresher
+
+        async def loop():
+            while True:
+                await asyncio.sleep(self.tick)
+                for key in self.due_hot_keys():
+                    self._refresh_in_task(key)
+
+        self._refresher = asyncio.get_running_loop().create_task(loop())
+        return self._refresher
+
+    async def stop_async_refresher(self):
+        if isinstance(self._refresher, asyncio.Task):
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, *self._tasks, return_exceptions=True)
+        self._refresher = None
+
+    def stats(self):
+        with self._lock:
+            stats = {"entries": len(self._entries), **self.counters}
+        if self.store is not None:
+            stats["disk_store"] = self.store.stats()
+        return stats
+
+
+# --------- Presets for the example tools ---------
+def weather_key(city, country, units):
+    return (city.strip().lower(), (country or "").strip().lower(), units)
+
+
+def new_weather_cache():
+    return ToolCache(
+        "openweather",
+        OPENWEATHER_POLICY,
+        refresh_budget_per_hour=int(os.getenv("OPENWEATHER_REFRESH_BUDGET_PER_HOUR", "600")),
+        store=shared_disk_store(),
+        namespace=f"openweather/{TOOL_RESULT_FORMAT}",
+    )
+
+
+def new_air_quality_cache():
+    return ToolCache(
+        "airnow",
+        AIRNOW_POLICY,
+        refresh_budget_per_hour=int(os.getenv("AIRNOW_REFRESH_BUDGET_PER_HOUR", "200")),
+        store=shared_disk_store(),
+        namespace=f"airnow/{TOOL_RESULT_FORMAT}",
+    )
@@ -0,0 +1,125 @@
+"""
+Tool result formatting shared by the Ex 2-5 agents.
+
+Every tool result stays in the conversation history and is resent on each later
+model call, so its size is paid for again on every turn. Two formats are
+available, selected with the TOOL_RESULT_FORMAT environment variable:
+
+- "prose"   (default) the original readable summary, e.g.
+            "Weather in Paris,FR: light rain | Temperature: 7.31° (feels like ...) | ..."
+- "compact" minimal JSON with short keys and rounded numbers, e.g.
+            {"loc":"Paris,FR","desc":"light rain","temp":7,"feels":5,"hum":81,"wind":4.1}
+
+In compact mode, condense_stale_tool_results() also shrinks tool results that
+the model has already answered from down to their key fields.
+"""
+import json
+import os
+
+TOOL_RESULT_FORMAT = os.getenv("TOOL_RESULT_FORMAT", "prose").lower()
+
+# Fields kept when an already-answered compact result is condensed
+CONDENSED_KEYS = ("loc", "zip", "desc", "temp", "aqi", "cat")
+
+
+def to_json(data) -> str:
+    """Serialize without whitespace (every byte is resent on later turns)."""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def _round(value, digits=0):
+    if not isinstance(value, (int, float)):
+        return value
+    return round(value) if digits == 0 else round(value, digits)
+
+
+# --------- Weather ---------
+def format_weather_result(q, desc, temp, feels_like, humidity, wind_speed, result_format=None) -> str:
+    """Format an OpenWeather observation for location `q` ("City,Country")."""
+    if (result_format or TOOL_RESULT_FORMAT) == "compact":
+        return to_json({
+            "loc": q,
+            "desc": desc,
+            "temp": _round(temp),
+            "feels": _round(feels_like),
+            "hum": humidity,
+            "wind": _round(wind_speed, 1),
+        })
+
+    # Build a readable summary
+    parts = [
+        f"Weather in {q}: {desc}",
+        f"Temperature: {temp}° (feels like {feels_like}°)",
+        f"Humidity: {humidity}%",
+        f"Wind speed: {wind_speed} m/s",
+    ]
+    return " | ".join(parts)
+
+
+# --------- Air quality ---------
+def format_air_quality_result(zip_code, hour, aqi, category, param, result_format=None) -> str:
+    """Format an AirNow observation for `zip_code`."""
+    if (result_format or TOOL_RESULT_FORMAT) == "compact":
+        return to_json({
+            "zip": zip_code,
+            "hr": hour,
+            "aqi": aqi,
+            "cat": category,
+            "pol": param,
+        })
+
+    return f"Air quality at ZIP {zip_code} ({hour}:00): AQI {aqi} ({category}) for {param}"
+
+
+# --------- History condensing ---------
+def _role(message):
+    """Role of a message given as an OpenAI dict or a LangChain message."""
+    if isinstance(message, dict):
+        return message.get("role")
+    return {"ai": "assistant", "tool": "tool"}.get(getattr(message, "type", None))
+
+
+def _condense(content):
+    """Return the condensed form of a compact result, or None to leave it as-is."""
+    if not isinstance(content, str) or not content.startswith("{"):
+        return None  # prose results and error messages are left untouched
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    condensed = {k: data[k] for k in CONDENSED_KEYS if k in data}
+    if not condensed or len(condensed) == len(data):
+        return None
+    return to_json(condensed)
+
+
+def condense_stale_tool_results(messages):
+    """
+    Return `messages` with compact tool results that precede the latest assistant
+    message reduced to their key fields.
+
+    Results after the latest assistant message are the ones the model is about
+    to read, so they are kept whole. The input list and its messages are not
+    modified; only condensed entries are copied.
+    """
+    last_assistant = -1
+    for i, message in enumerate(messages):
+        if _role(message) == "assistant":
+            last_assistant = i
+
+    condensed_messages = list(messages)
+    for i in range(last_assistant):
+        message = messages[i]
+        if _role(message) != "tool":
+            continue
+        content = message["content"] if isinstance(message, dict) else message.content
+        condensed = _condense(content)
+        if condensed is None:
+            continue
+        if isinstance(message, dict):
+            condensed_messages[i] = {**message, "content": condensed}
+        else:
+            condensed_messages[i] = message.model_copy(update={"content": condensed})
+    return condensed_messages
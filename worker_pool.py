@@ -0,0 +1,467 @@
+"""
+Multi-process worker pool for the agents: one dispatcher, N worker processes.
+
+A single agent process is bound to one core for JSON handling, history
+management and (in Ex 5) LangChain/LangGraph overhead. WorkerPool runs the
+agent loop in N processes so throughput scales with cores on one machine:
+
+- Sticky sessions: a session is pinned to one worker the first time it is
+  seen (the worker with the fewest sessions), so its `messages` history stays
+  in that process and is never shipped back and forth.
+- Graceful recycling: after `max_turns_per_worker` turns a replacement process
+  is started, the old one finishes its in-flight turns, hands its session
+  histories over and exits. Turns that arrive meanwhile wait in the dispatcher
+  and go to the replacement, so no session loses its history. If the old
+  process dies before the hand-over, the turns it held fail and the
+  replacement starts with empty histories.
+- Idle sessions: a session with no turn for `session_ttl` seconds (default
+  one hour) is forgotten as if end_session() had been called.
+- Per-worker load: stats() / print_worker_table() report sessions, in-flight
+  and served turns, errors, busy time and CPU seconds for every worker.
+
+Agents: "ex3" and "ex4" (raw SDK run_turn(), a thread pool per worker) and
+"ex5" (LangGraph graph, asyncio tasks per worker; like the Ex 5 CLI every turn
+starts from the system prompt, so its sessions carry no history).
+
+Set TOOL_CACHE_DB so the workers share tool results (see disk_cache.py).
+
+Usage:
+
+    from worker_pool import WorkerPool
+
+    with WorkerPool("ex3", workers=4) as pool:
+        reply = pool.run_turn("alice", "What's the weather in Paris, FR?")
+"""
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from example_loader import load_example
+
+AGENTS = {"ex3": 3, "ex4": 4, "ex5": 5}
+
+
+# --------- Worker process ---------
+def _plain(messages):
+    """A message history with SDK objects (assistant tool_calls) turned into plain dicts."""
+    def default(obj):
+        if hasattr(obj, "model_dump"):
+            return obj.model_dump()
+        return str(obj)
+
+    return json.loads(json.dumps(messages, default=default))
+
+
+def _serve_sdk(module, agent, slot, generation, requests, results, concurrency):
+    """Serve Ex 3/4 turns on a thread pool; return the session histories when told to stop."""
+    histories = {}
+    locks = defaultdict(threading.Lock)
+
+    def turn(request_id, session_id, text):
+        with locks[session_id]:  # one turn at a time per conversation
+            messages = histories.setdefault(session_id, [{"role": "system", "content": module.SYSTEM_PROMPT}])
+            start = time.perf_counter()
+            reply, error = None, None
+            try:
+                reply = module.run_turn(messages, text)
+                if agent == "ex4":
+                    reply = reply[0]  # (assistant_message, used_tools)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - start
+        results.put(("done", slot, generation, request_id, reply, error, elapsed, time.process_time()))
+
+    module.weather_cache.start_refresher()
+    module.air_quality_cache.start_refresher()
+    with ThreadPoolExecutor(concurrency, thread_name_prefix=f"worker{slot}") as pool:
+        while True:
+            message = requests.get()
+            kind = message[0]
+            if kind == "turn":
+                pool.submit(turn, *message[1:])
+            elif kind == "adopt":
+                histories.update(message[1])
+            elif kind == "end":
+                histories.pop(message[1], None)
+            elif kind == "stop":
+                break
+    # leaving the executor waits for the in-flight turns
+    return {session_id: _plain(messages) for session_id, messages in histories.items()}
+
+
+async def _serve_graph(module, slot, generation, requests, results, concurrency):
+    """Serve Ex 5 turns as asyncio tasks on one event loop."""
+    from langchain_core.messages import HumanMessage
+
+    app, _ = module.create_graph()  # AGENT_GRAPH picks the cycle or the fan-out graph
+    system_msg = HumanMessage(content=module.SYSTEM_PROMPT)
+    limit = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def turn(request_id, session_id, text):
+        async with limit:
+            start = time.perf_counter()
+            reply, error = None, None
+            try:
+                state = {"messages": [system_msg, HumanMessage(content=text)], "tools_used": []}
+                output = await app.ainvoke(state, {"configurable": {"thread_id": session_id}})
+                reply = output["messages"][-1].content
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - start
+        results.put(("done", slot, generation, request_id, reply, error, elapsed, time.process_time()))
+
+    module.weather_cache.start_async_refresher()
+    module.air_quality_cache.start_async_refresher()
+    try:
+        while True:
+            message = await asyncio.to_thread(requests.get)
+            if message[0] == "turn":
+                task = asyncio.create_task(turn(*message[1:]))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            elif message[0] == "stop":
+                break
+        await asyncio.gather(*tasks)
+    finally:
+        await module.weather_cache.stop_async_refresher()
+        await module.air_quality_cache.stop_async_refresher()
+        await module.close_http_client()
+    return {}
+
+
+def _worker_main(agent, slot, generation, requests, results, concurrency, quiet):
+    if quiet:
+        sys.stdout = open(os.devnull, "w")  # the examples print progress for every tool call
+    module = load_example(AGENTS[agent])
+    results.put(("ready", slot, generation, os.getpid()))
+    if agent == "ex5":
+        sessions = asyncio.run(_serve_graph(module, slot, generation, requests, results, concurrency))
+    else:
+        sessions = _serve_sdk(module, agent, slot, generation, requests, results, concurrency)
+    results.put(("retired", slot, generation, sessions))
+
+
+# --------- Dispatcher ---------
+class _Slot:
+    """One worker position; its process is replaced on recycling, the slot stays."""
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.requests = None
+        self.generation = 0
+        self.pid = None
+        self.draining = False
+        self.retiring = None  # the process being drained, until it hands its sessions over
+        self.retiring_generation = 0
+        self.backlog = []
+        self.sessions = 0  # pinned to this slot
+        self.in_flight = 0
+        self.turns = 0  # served by the current process
+        self.turns_total = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.cpu_seconds = {}  # generation -> CPU seconds its process reported last
+        self.recycles = 0
+
+
+class WorkerPool:
+    """Dispatch session turns to N agent worker processes with sticky routing."""
+
+    def __init__(self, agent="ex3", workers=None, concurrency=8, max_turns_per_worker=1000,
+                 quiet=True, start_timeout=60.0, session_ttl=3600.0):
+        if agent not in AGENTS:
+            raise ValueError(f"Unknown agent {agent!r}; expected one of {', '.join(AGENTS)}")
+        self.agent = agent
+        self.workers = workers or os.cpu_count() or 1
+        self.concurrency = concurrency
+        self.max_turns_per_worker = max_turns_per_worker
+        self.quiet = quiet
+        self.start_timeout = start_timeout
+        self.session_ttl = session_ttl
+
+        # spawn: same behaviour on Windows, macOS and Linux, and no forked locks or sockets
+        self._ctx = multiprocessing.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._slots = [_Slot(i) for i in range(self.workers)]
+        self._sessions = OrderedDict()  # session id -> slot index, least recently used first
+        self._last_used = {}  # session id -> monotonic time of its last turn
+        self._pending = {}  # request id -> (future, slot index, generation serving it, session id)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._ready = threading.Semaphore(0)
+        self._collector = None
+        self._closed = False
+
+    # ----- lifecycle -----
+    def start(self):
+        for slot in self._slots:
+            self._spawn(slot)
+        self._collector = threading.Thread(target=self._collect, name="worker-pool-results", daemon=True)
+        self._collector.start()
+        for _ in self._slots:
+            if not self._ready.acquire(timeout=self.start_timeout):
+                self.close()
+                raise RuntimeError("Worker processes did not start in time")
+        return self
+
+    def _spawn(self, slot):
+        slot.generation += 1
+        slot.requests = self._ctx.Queue()
+        slot.process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.agent, slot.index, slot.generation, slot.requests, self._results,
+                  self.concurrency, self.quiet),
+            name=f"agent-worker-{slot.index}",
+            daemon=True,
+        )
+        slot.process.start()
+        slot.turns = 0
+
+    def close(self):
+        """Let every worker finish its in-flight turns, then stop it."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            processes = []
+            for slot in self._slots:
+                for pending in slot.backlog:
+                    slot.requests.put(pending)
+                slot.backlog.clear()
+                slot.requests.put(("stop",))
+                processes.append(slot.process)
+                if slot.retiring is not None:
+                    processes.append(slot.retiring)
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        if self._collector is not None:
+            self._results.put(("shutdown",))
+            self._collector.join(timeout=5)
+        with self._lock:
+            unfinished, self._pending = self._pending, {}
+        for future, *_ in unfinished.values():
+            future.set_exception(RuntimeError("WorkerPool closed before the turn finished"))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ----- routing -----
+    def _slot_for(self, session_id):
+        index = self._sessions.get(session_id)
+        if index is None:
+            index = min(self._slots, key=lambda s: (s.sessions, s.in_flight)).index
+            self._sessions[session_id] = index
+            self._slots[index].sessions += 1
+        else:
+            self._sessions.move_to_end(session_id)
+        self._last_used[session_id] = time.monotonic()
+        return self._slots[index]
+
+    def _send(self, slot, message):
+        if slot.draining:
+            slot.backlog.append(message)
+        else:
+            slot.requests.put(message)
+
+    def _forget(self, session_id):
+        """Unpin a session and drop its history in its worker (caller holds the lock)."""
+        index = self._sessions.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+        if index is not None:
+            slot = self._slots[index]
+            slot.sessions -= 1
+            self._send(slot, ("end", session_id))
+
+    def _expire_sessions(self):
+        """Forget sessions idle for longer than session_ttl (caller holds the lock)."""
+        if not self.session_ttl:
+            return
+        cutoff = time.monotonic() - self.session_ttl
+        idle = list(itertools.takewhile(lambda s: self._last_used[s] <= cutoff, self._sessions))
+        if idle:  # least recently used first, so the scan stops at the first recent session
+            busy = {session_id for *_, session_id in self._pending.values()}
+            for session_id in idle:
+                if session_id not in busy:
+                    self._forget(session_id)
+
+    def submit(self, session_id, text):
+        """Queue one user turn for `session_id`; return a Future resolving to the assistant's reply."""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("WorkerPool is closed")
+            self._expire_sessions()
+            slot = self._slot_for(session_id)
+            request_id = next(self._ids)
+            # while draining, the turn waits in the backlog for the replacement (the current generation)
+            self._pending[request_id] = (future, slot.index, slot.generation, session_id)
+            slot.in_flight += 1
+            self._send(slot, ("turn", request_id, session_id, text))
+        return future
+
+    def run_turn(self, session_id, text, timeout=None):
+        """Run one user turn and return the reply (raises RuntimeError if the turn failed)."""
+        return self.submit(session_id, text).result(timeout)
+
+    def end_session(self, session_id):
+        """Forget a session and drop its history in its worker."""
+        with self._lock:
+            self._forget(session_id)
+
+    # ----- recycling -----
+    def _begin_recycle(self, slot):
+        """Start the replacement and ask the current process to drain (caller holds the lock)."""
+        slot.draining = True
+        slot.retiring, slot.retiring_generation = slot.process, slot.generation
+        slot.requests.put(("stop",))
+        slot.recycles += 1
+        self._spawn(slot)  # warms up while the old process drains
+
+    def _finish_recycle(self, slot, sessions):
+        """Hand the drained sessions to the replacement, then release the turns held meanwhile."""
+        slot.requests.put(("adopt", sessions))
+        for message in slot.backlog:
+            slot.requests.put(message)
+        slot.backlog.clear()
+        slot.draining = False
+        retired, slot.retiring = slot.retiring, None
+        threading.Thread(target=retired.join, daemon=True).start()
+
+    def _collect(self):
+        last_check = time.monotonic()
+        while True:
+            try:
+                message = self._results.get(timeout=1.0)
+            except queue.Empty:
+                message = ("idle",)
+            kind = message[0]
+            if kind == "shutdown":
+                return
+            if kind == "ready":
+                _, index, generation, pid = message
+                with self._lock:
+                    slot = self._slots[index]
+                    if generation == slot.generation:
+                        slot.pid = pid
+                if generation == 1:
+                    self._ready.release()
+            elif kind == "done":
+                self._turn_done(*message[1:])
+            elif kind == "retired":
+                _, index, generation, sessions = message
+                with self._lock:
+                    slot = self._slots[index]
+                    if slot.draining and generation == slot.retiring_generation:
+                        self._finish_recycle(slot, sessions)
+            # after the message, so a worker's last results count before its exit does
+            if time.monotonic() - last_check >= 1.0:  # also while results keep arriving
+                last_check = time.monotonic()
+                self._check_workers()
+
+    def _turn_done(self, index, generation, request_id, reply, error, elapsed, cpu):
+        with self._lock:
+            future, _, _, session_id = self._pending.pop(request_id, (None, None, None, None))
+            if session_id in self._last_used:  # idle time counts from the end of the turn
+                self._last_used[session_id] = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            slot = self._slots[index]
+            if future is not None:  # else already failed and uncounted by _fail_turns() or close()
+                slot.in_flight -= 1
+            slot.turns_total += 1
+            slot.busy_seconds += elapsed
+            if error:
+                slot.errors += 1
+            slot.cpu_seconds[generation] = max(cpu, slot.cpu_seconds.get(generation, 0.0))
+            if generation == slot.generation:
+                slot.turns += 1
+                if (self.max_turns_per_worker and slot.turns >= self.max_turns_per_worker
+                        and not slot.draining and not self._closed):
+                    self._begin_recycle(slot)
+        if future is not None:
+            if error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(reply)
+
+    def _fail_turns(self, slot, generation, exitcode):
+        """Fail the turns sent to one process of `slot` (caller holds the lock)."""
+        held = {message[1] for message in slot.backlog if message[0] == "turn"}  # never sent, still to be served
+        lost = [rid for rid, (_, index, gen, _) in self._pending.items()
+                if index == slot.index and gen == generation and rid not in held]
+        for request_id in lost:
+            future, *_ = self._pending.pop(request_id)
+            future.set_exception(RuntimeError(f"Worker {slot.index} exited with code {exitcode}"))
+        slot.in_flight -= len(lost)
+
+    def _check_workers(self):
+        """Fail the turns of a worker that died and start a fresh one in its slot (its histories are lost)."""
+        with self._lock:
+            if self._closed:
+                return
+            self._expire_sessions()
+            for slot in self._slots:
+                if not slot.process.is_alive():
+                    self._fail_turns(slot, slot.generation, slot.process.exitcode)
+                    slot.recycles += 1
+                    self._spawn(slot)
+                    if slot.draining:
+                        # The replacement died while the old process drains; the backlog goes to its successor
+                        for message in slot.backlog:
+                            if message[0] == "turn" and message[1] in self._pending:
+                                future, index, _, session_id = self._pending[message[1]]
+                                self._pending[message[1]] = (future, index, slot.generation, session_id)
+                if slot.draining and self._retiring_lost(slot):
+                    # Died before handing its sessions over: release the backlog to the replacement
+                    self._fail_turns(slot, slot.retiring_generation, slot.retiring.exitcode)
+                    self._finish_recycle(slot, {})
+
+    def _retiring_lost(self, slot):
+        """Whether the draining process of `slot` exited without its hand-over (caller holds the lock)."""
+        if slot.retiring.is_alive():
+            return False
+        # A clean exit puts "retired" on the results queue first: wait until the queue is drained
+        return slot.retiring.exitcode != 0 or self._results.empty()
+
+    # ----- load reporting -----
+    def stats(self):
+        """Per-worker load: pinned sessions, turns, errors, busy time and CPU seconds."""
+        with self._lock:
+            return [
+                {
+                    "worker": slot.index,
+                    "pid": slot.pid,
+                    "generation": slot.generation,
+                    "sessions": slot.sessions,
+                    "in_flight": slot.in_flight,
+                    "turns": slot.turns_total,
+                    "errors": slot.errors,
+                    "busy_s": slot.busy_seconds,
+                    "cpu_s": sum(slot.cpu_seconds.values()),
+                    "recycles": slot.recycles,
+                }
+                for slot in self._slots
+            ]
+
+
+def print_worker_table(stats):
+    print(f"{'worker':>6} {'pid':>8} {'gen':>4} {'sessions':>8} {'in-flight':>9} {'turns':>6} "
+          f"{'errors':>6} {'busy s':>8} {'cpu s':>7} {'recycles':>8}")
+    print("-" * 82)
+    for w in stats:
+        print(f"{w['worker']:>6} {w['pid'] or '-':>8} {w['generation']:>4} {w['sessions']:>8} {w['in_flight']:>9} "
+              f"{w['turns']:>6} {w['errors']:>6} {w['busy_s']:>8.1f} {w['cpu_s']:>7.2f} {w['recycles']:>8}")